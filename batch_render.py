@@ -0,0 +1,73 @@
+import os
+from multiprocessing import Pool
+from plot_functions import use_headless_backend
+
+
+def _init_worker():
+    use_headless_backend()
+
+
+def render_job(job):
+    """
+    Render one figure headless.
+
+    Parameters:
+    job (dict): 'plot': 'overview', 'compare_CO', 'compare_CO_3bars' or 'compare_pressure_3bars'
+                'output_dir': directory for the files, 'name': file name without extension,
+                'formats': tuple of file formats (default ('png',)).
+                For 'overview': 'trace_path' of a stored TraceSet and optionally 'pv_color'
+                ('beat' or 'phase', see OverviewTemplate).
+                For the comparisons: 'n_beats', 'args' and optionally 'kwargs' (the arguments of
+                the plot method, e.g. plot_grouped_bars).
+
+    Returns:
+    list: Paths of the written files.
+    """
+    use_headless_backend()
+    from plot_functions import HemodynamicPlotter
+    formats = job.get('formats', ('png',))
+
+    if job['plot'] == 'overview':
+        from trace_store import TraceSet
+        from cardiac_calculations import calculate_CO_per_beat
+        from heartrate import HeartRateTimeline
+        from trace_pyramid import stored_pyramids
+        traces = TraceSet.load(job['trace_path'])
+        plotter = HemodynamicPlotter(traces, traces.cycle_times, traces.n_beats, traces.breath_cycle_time,
+                                     pyramids=stored_pyramids(job['trace_path'], traces),
+                                     save_dir=job['output_dir'], formats=formats,
+                                     pv_color=job.get('pv_color', 'beat'))
+        timeline = HeartRateTimeline.for_model(traces, traces.cycle_times, traces.breath_cycle_time)
+        aortic_CO = calculate_CO_per_beat(traces['Valve']['q'][:, 'LvSyArt'], timeline)[:traces.n_beats]
+        pulmonary_CO = calculate_CO_per_beat(traces['Valve']['q'][:, 'RvPuArt'], timeline)[:traces.n_beats]
+        return plotter.plot_overview(aortic_CO, pulmonary_CO, filename=job['name'])
+
+    plotter = HemodynamicPlotter(None, None, job['n_beats'], None,
+                                 save_dir=job['output_dir'], formats=formats)
+    return getattr(plotter, job['plot'])(*job['args'], filename=job['name'], **job.get('kwargs', {}))
+
+
+def overview_jobs(trace_paths, output_dir, formats=('png',)):
+    """
+    One overview job per stored run, named after the trace file.
+    """
+    return [{'plot': 'overview', 'trace_path': path, 'output_dir': output_dir, 'formats': formats,
+             'name': os.path.splitext(os.path.basename(path))[0] + '_overview'}
+            for path in trace_paths]
+
+
+def render_batch(jobs, n_workers=None):
+    """
+    Render figures in parallel worker processes on the Agg backend.
+
+    Parameters:
+    jobs (list): Job dicts, see render_job and overview_jobs.
+    n_workers (int, optional): Number of worker processes (default: number of cores).
+
+    Returns:
+    list: Paths of all written files.
+    """
+    n_workers = n_workers or os.cpu_count()
+    with Pool(n_workers, initializer=_init_worker) as pool:
+        results = pool.map(render_job, jobs, chunksize=max(1, len(jobs) // (4 * n_workers)))
+    return [path for paths in results for path in paths]
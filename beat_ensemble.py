@@ -0,0 +1,88 @@
+import numpy as np
+from heartrate import HeartRateTimeline
+from trace_store import SIGNALS
+from trace_pyramid import signal_key
+
+# Signals resampled by default: pressures and volumes of all cavities and all valve flows
+ENSEMBLE_VARIABLES = [('Cavity', 'p'), ('Cavity', 'V'), ('Valve', 'q')]
+
+
+def resample_beats(t, data, beat_starts, beat_ends, n_phase=100):
+    """
+    Map every beat onto a common normalized phase grid with one linear interpolation
+    over all beats and signals.
+
+    Parameters:
+    t (ndarray): Time points (n).
+    data (ndarray): Signal values (n x n_signals).
+    beat_starts (ndarray): First sample of every beat.
+    beat_ends (ndarray): Sample after the last sample of every beat (the next beat start).
+    n_phase (int): Number of phase points, phase k / n_phase for k = 0 .. n_phase - 1.
+
+    Returns:
+    ndarray: Resampled beats (n_beats x n_signals x n_phase).
+    """
+    t = np.asarray(t, dtype=float)
+    data = np.asarray(data, dtype=float).reshape(len(t), -1)
+    n = len(t)
+    phase = np.arange(n_phase) / n_phase
+
+    # A beat runs from its start to the next beat start (the last beat to the last sample)
+    t_start = t[beat_starts]
+    t_end = t[np.minimum(beat_ends, n - 1)]
+    times = t_start[:, None] + phase * (t_end - t_start)[:, None]
+
+    # Fractional sample index of every (beat, phase) point, then one gather for all signals
+    position = np.interp(times, t, np.arange(n))
+    i = np.minimum(position.astype(int), n - 2)
+    fraction = (position - i)[..., None]
+    resampled = data[i] * (1 - fraction) + data[i + 1] * fraction
+    return np.moveaxis(resampled, -1, 1)
+
+
+class BeatEnsemble:
+    def __init__(self, traces, cycle_times, breath_cycle_time, variables=ENSEMBLE_VARIABLES, n_phase=100):
+        """
+        Every stored beat resampled onto a normalized phase grid (0 = beat start, 1 = next
+        beat start), so beats of different length can be compared sample by sample.
+
+        Parameters:
+        traces: Model or stored TraceSet that contains all the data.
+        cycle_times (list): List of cycle times for each beat.
+        breath_cycle_time (float): Length of one breathing cycle [s].
+        variables (list): (component, variable) pairs to resample, all names of SIGNALS are used.
+        n_phase (int): Number of phase points per beat.
+        """
+        timeline = HeartRateTimeline.for_model(traces, cycle_times, breath_cycle_time)
+        self.phase = np.arange(n_phase) / n_phase
+        self.beat_in_breath = timeline.beat_in_breath
+        self.keys = [signal_key(component, var, name)
+                     for component, var in variables for name in SIGNALS[(component, var)]]
+        data = np.column_stack([traces[component][var][:, SIGNALS[(component, var)]]
+                                for component, var in variables])
+        self.beats = resample_beats(timeline.time_points, data, timeline.beat_starts, timeline.beat_ends, n_phase)
+
+    def matrix(self, component, var, name):
+        """
+        Returns:
+        ndarray: Resampled beats of one signal (n_beats x n_phase).
+        """
+        return self.beats[:, self.keys.index(signal_key(component, var, name))]
+
+    def mean(self, beats=None):
+        """
+        Ensemble average waveform of every signal (n_signals x n_phase).
+
+        Parameters:
+        beats (ndarray, optional): Index or boolean mask of the beats to average (default: all),
+                                   e.g. ensemble.beat_in_breath == 0.
+        """
+        selection = self.beats if beats is None else self.beats[beats]
+        return selection.mean(axis=0)
+
+    def std(self, beats=None):
+        """
+        Ensemble standard deviation of every signal (n_signals x n_phase), see mean.
+        """
+        selection = self.beats if beats is None else self.beats[beats]
+        return selection.std(axis=0)
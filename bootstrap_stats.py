@@ -0,0 +1,148 @@
+import numpy as np
+
+# Number of samples drawn at once (resamples x samples), bounds the memory of the index matrices
+CHUNK_ELEMENTS = 200000
+
+
+def _mean(values, axis):
+    return np.mean(values, axis=axis)
+
+
+def _weighted_sums(weights, values):
+    # Sum of the samples with a weight (count) per resample: (size x n) @ (n x ...) -> (size x ...)
+    return (weights @ values.reshape(len(values), -1)).reshape((len(weights),) + values.shape[1:])
+
+
+def bootstrap_distribution(values, statistic=_mean, n_resamples=10000, seed=None):
+    """
+    Bootstrap distribution of a statistic: all resamples are drawn as one index matrix
+    per chunk and evaluated in a single vectorized call. For the default mean the samples
+    are not gathered: the resample counts of every sample give the means as one matrix product.
+
+    Parameters:
+    values (ndarray): Samples along the first axis (n x ...), e.g. runs x beats x metrics.
+    statistic (callable): Function (array, axis) -> statistic over that axis (default: mean).
+    n_resamples (int): Number of bootstrap resamples.
+    seed (int, optional): Seed of the random generator.
+
+    Returns:
+    ndarray: Statistic of every resample (n_resamples x ...).
+    """
+    values = np.asarray(values, dtype=float)
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    chunk = max(CHUNK_ELEMENTS // n, 1)
+    results = []
+    for start in range(0, n_resamples, chunk):
+        size = min(chunk, n_resamples - start)
+        index = rng.integers(0, n, size=(size, n))
+        if statistic is _mean:
+            counts = np.bincount((index + n * np.arange(size)[:, None]).ravel(), minlength=size * n)
+            results.append(_weighted_sums(counts.reshape(size, n).astype(float), values) / n)
+        else:
+            results.append(statistic(values[index], axis=1))
+    return np.concatenate(results)
+
+
+def bootstrap_ci(values, statistic=_mean, n_resamples=10000, confidence=0.95, seed=None):
+    """
+    Percentile bootstrap confidence interval of a statistic.
+
+    Parameters:
+    values (ndarray): Samples along the first axis (n x ...).
+    statistic, n_resamples, seed: See bootstrap_distribution.
+    confidence (float): Confidence level of the interval.
+
+    Returns:
+    tuple: (statistic of the data, lower bound, upper bound), each of shape values.shape[1:].
+    """
+    distribution = bootstrap_distribution(values, statistic, n_resamples, seed)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(distribution, [alpha, 1 - alpha], axis=0)
+    return statistic(np.asarray(values, dtype=float), axis=0), low, high
+
+
+def bootstrap_difference(a, b, statistic=_mean, n_resamples=10000, confidence=0.95, seed=None):
+    """
+    Bootstrap confidence interval of statistic(a) - statistic(b) for two independent
+    groups (e.g. HFrEF and Healthy runs), both resampled within their own group.
+
+    Returns:
+    tuple: (difference of the data, lower bound, upper bound)
+    """
+    seed_a, seed_b = np.random.default_rng(seed).integers(0, 2 ** 32, size=2)
+    distribution_b = bootstrap_distribution(b, statistic, n_resamples, seed_b)
+    return _difference_ci(a, b, distribution_b, statistic, n_resamples, confidence, seed_a)
+
+
+def _difference_ci(a, b, distribution_b, statistic, n_resamples, confidence, seed_a):
+    # Percentile interval of the difference, with the bootstrap distribution of b given
+    difference = bootstrap_distribution(a, statistic, n_resamples, seed_a) - distribution_b
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(difference, [alpha, 1 - alpha], axis=0)
+    observed = statistic(np.asarray(a, dtype=float), axis=0) - statistic(np.asarray(b, dtype=float), axis=0)
+    return observed, low, high
+
+
+def permutation_test(a, b, statistic=_mean, n_resamples=10000, seed=None):
+    """
+    Two-sided permutation test of statistic(a) - statistic(b). The group labels of the
+    pooled samples are shuffled as one permutation matrix per chunk. For the default mean
+    only the group sums are needed: a random membership matrix of group a times the samples.
+
+    Returns:
+    tuple: (difference of the data, p-value), each of shape a.shape[1:].
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    pooled = np.concatenate([a, b])
+    n_a, n = len(a), len(a) + len(b)
+    observed = statistic(a, axis=0) - statistic(b, axis=0)
+    total = np.sum(pooled, axis=0)
+
+    rng = np.random.default_rng(seed)
+    exceed = np.zeros(np.shape(observed))
+    chunk = max(CHUNK_ELEMENTS // n, 1)
+    for start in range(0, n_resamples, chunk):
+        size = min(chunk, n_resamples - start)
+        if statistic is _mean:
+            # Random group a: the n_a samples with the smallest random keys
+            keys = rng.random((size, n))
+            in_a = keys <= np.partition(keys, n_a - 1, axis=1)[:, n_a - 1:n_a]
+            sum_a = _weighted_sums(in_a.astype(float), pooled)
+            difference = sum_a / n_a - (total - sum_a) / (n - n_a)
+        else:
+            index = rng.permuted(np.broadcast_to(np.arange(n), (size, n)), axis=1)
+            shuffled = pooled[index]
+            difference = statistic(shuffled[:, :n_a], axis=1) - statistic(shuffled[:, n_a:], axis=1)
+        exceed += np.sum(np.abs(difference) >= np.abs(observed), axis=0)
+    return observed, (exceed + 1) / (n_resamples + 1)
+
+
+def compare_conditions(groups, reference, statistic=_mean, n_resamples=10000, confidence=0.95, seed=None):
+    """
+    Compare every condition with a reference condition (bootstrap_difference and
+    permutation_test); the bootstrap distribution of the reference is drawn once.
+
+    Usage:
+        compare_conditions({'Healthy': CO_healthy, 'HFrEF': CO_hfref, 'HFpEF': CO_hfpef}, 'Healthy')
+
+    Parameters:
+    groups (dict): Condition -> samples (runs x ...), e.g. per-beat CO of every run.
+    reference (str): Condition the others are compared with.
+
+    Returns:
+    dict: Condition -> dict with 'difference', 'ci_low', 'ci_high' and 'p_value'.
+    """
+    # Same seeds as bootstrap_difference(values, groups[reference], ..., seed) for every condition
+    seed_a, seed_b = np.random.default_rng(seed).integers(0, 2 ** 32, size=2)
+    distribution_reference = bootstrap_distribution(groups[reference], statistic, n_resamples, seed_b)
+    results = {}
+    for condition, values in groups.items():
+        if condition == reference:
+            continue
+        difference, low, high = _difference_ci(values, groups[reference], distribution_reference, statistic,
+                                               n_resamples, confidence, seed_a)
+        _, p_value = permutation_test(values, groups[reference], statistic, n_resamples, seed)
+        results[condition] = {'difference': difference, 'ci_low': low, 'ci_high': high, 'p_value': p_value}
+    return results
@@ -107,4 +107,50 @@ class CardiacCalculator:
             LA_pressure_values.append(mean_LA_pressure_i)
             timer += cycle_time
 
-        return LA_pressure_values
\ No newline at end of file
+        return LA_pressure_values
+
+
+def calculate_stroke_work(V, p, beat_starts):
+    """
+    Calculate the stroke work (pressure-volume loop area) of every beat at once.
+
+    Parameters:
+    V (ndarray): Volume values (e.g. in ml), (n) or (n x n_chambers).
+    p (ndarray): Pressure values (e.g. in mmHg), same shape.
+    beat_starts (ndarray): Sample index at which every beat starts.
+
+    Returns:
+    ndarray: Loop area per beat (n_beats or n_beats x n_chambers) in units of V * p
+             (ml*mmHg = 133.3e-6 J), positive for a counterclockwise loop.
+    """
+    V = np.asarray(V, dtype=float)
+    p = np.asarray(p, dtype=float)
+    beat_starts = np.asarray(beat_starts)
+    beat_ends = np.append(beat_starts[1:], len(V) - 1)  # loop closes at the next beat start
+
+    # Shoelace formula: sum of cross products along the loop plus the closing segment
+    cross = V[:-1] * p[1:] - V[1:] * p[:-1]
+    cumulative = np.concatenate([np.zeros((1,) + V.shape[1:]), np.cumsum(cross, axis=0)])
+    along = cumulative[beat_ends] - cumulative[beat_starts]
+    closing = V[beat_ends] * p[beat_starts] - V[beat_starts] * p[beat_ends]
+    return 0.5 * (along + closing)
+
+
+def calculate_CO_per_beat(flow, timeline):
+    """
+    Calculate the cardiac output of every stored beat at once, from one cumulative
+    trapezoid integral of the flow (same numerics as CardiacCalculator.calculate_CO).
+
+    Parameters:
+    flow (ndarray): Array of flow values (e.g., flow_aortic_valve or flow_pulmonary_valve).
+    timeline (HeartRateTimeline): Beat boundaries and heart rate of the stored beats.
+
+    Returns:
+    ndarray: Cardiac output per beat (L/min).
+    """
+    flow = np.asarray(flow, dtype=float)
+    t = np.asarray(timeline.time_points, dtype=float)
+    cumulative = np.concatenate([[0], np.cumsum(0.5 * (flow[1:] + flow[:-1]) * np.diff(t))])
+    last = timeline.beat_ends - 1  # the integral of a beat ends at its last sample
+    stroke_volume = (cumulative[last] - cumulative[timeline.beat_starts]) * 1e3  # L
+    return stroke_volume * timeline.hr_per_beat
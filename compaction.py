@@ -0,0 +1,160 @@
+import json
+import numpy as np
+from trace_store import TraceSet
+
+
+def breath_shape(traces):
+    """
+    Number of stored breaths and samples per breath of a run.
+
+    Returns:
+    tuple: (n_breaths, samples_per_breath), n_breaths is 0 if the stored time
+           axis is not a whole number of breaths.
+    """
+    t = traces.t
+    dt = (t[-1] - t[0]) / (len(t) - 1)
+    samples_per_breath = int(round(traces.breath_cycle_time / dt))
+    if samples_per_breath == 0 or len(t) % samples_per_breath != 0:
+        return 0, samples_per_breath
+    return len(t) // samples_per_breath, samples_per_breath
+
+
+def breath_residuals(traces):
+    """
+    Difference of every stored breath with the last stored breath.
+
+    Returns:
+    dict: 'Component.var' -> array (n_breaths, samples_per_breath, n_columns).
+    """
+    n_breaths, samples_per_breath = breath_shape(traces)
+    if n_breaths == 0:
+        raise ValueError("Stored time axis is not a whole number of breaths")
+
+    residuals = {}
+    for key, array in traces.arrays.items():
+        if key == 'Solver.t':
+            continue
+        breaths = array.reshape(n_breaths, samples_per_breath, -1)
+        residuals[key] = breaths - breaths[-1]
+    return residuals
+
+
+def is_periodic(traces, rtol=1e-3):
+    """
+    Check if all stored breaths are equal to the last one, within rtol times
+    the range of each signal.
+    """
+    n_breaths, _ = breath_shape(traces)
+    if n_breaths < 2:
+        return False
+    for key, residual in breath_residuals(traces).items():
+        signal_range = np.ptp(traces.arrays[key].reshape(-1, residual.shape[-1]), axis=0)
+        if np.any(np.max(np.abs(residual), axis=(0, 1)) > rtol * signal_range):
+            return False
+    return True
+
+
+class CompactTraceSet:
+    def __init__(self, breath, t_breath, breath_period, n_breaths, residual_max, residual_rms, meta):
+        """
+        Traces of a periodic steady state run, stored as one representative
+        breath (the last stored one) plus residual statistics of the others.
+
+        Parameters:
+        breath (dict): 'Component.var' -> array (samples_per_breath, n_columns).
+        t_breath (ndarray): Time points of the first stored breath.
+        breath_period (float): Time between the starts of two stored breaths [s].
+        n_breaths (int): Number of stored breaths.
+        residual_max (dict): 'Component.var' -> max |breath - representative| per breath and column.
+        residual_rms (dict): 'Component.var' -> rms of the same residual per breath and column.
+        meta (dict): Meta data of the original TraceSet.
+        """
+        self.breath = breath
+        self.t_breath = t_breath
+        self.breath_period = breath_period
+        self.n_breaths = n_breaths
+        self.residual_max = residual_max
+        self.residual_rms = residual_rms
+        self.meta = meta
+
+    @classmethod
+    def from_traces(cls, traces, rtol=1e-3):
+        """
+        Compact traces if they are periodic within rtol.
+
+        Returns:
+        CompactTraceSet or None: None if the traces are not periodic.
+        """
+        if not is_periodic(traces, rtol):
+            return None
+        n_breaths, samples_per_breath = breath_shape(traces)
+        residuals = breath_residuals(traces)
+
+        t = traces.t
+        return cls(
+            breath={key: traces.arrays[key][-samples_per_breath:] for key in residuals},
+            t_breath=t[:samples_per_breath],
+            breath_period=float(t[samples_per_breath] - t[0]),
+            n_breaths=n_breaths,
+            residual_max={key: np.max(np.abs(r), axis=1) for key, r in residuals.items()},
+            residual_rms={key: np.sqrt(np.mean(r ** 2, axis=1)) for key, r in residuals.items()},
+            meta=traces.meta,
+        )
+
+    def expand(self):
+        """
+        Returns:
+        TraceSet: Full traces with the representative breath repeated n_breaths times.
+        """
+        offsets = np.arange(self.n_breaths)[:, None] * self.breath_period
+        arrays = {'Solver.t': (self.t_breath[None, :] + offsets).ravel()}
+        for key, breath in self.breath.items():
+            arrays[key] = np.tile(breath, (self.n_breaths, 1))
+        return TraceSet(arrays, self.meta)
+
+    def save(self, path):
+        arrays = {'t_breath': self.t_breath}
+        for key in self.breath:
+            arrays['breath:' + key] = self.breath[key]
+            arrays['residual_max:' + key] = self.residual_max[key]
+            arrays['residual_rms:' + key] = self.residual_rms[key]
+        info = {'breath_period': self.breath_period, 'n_breaths': self.n_breaths}
+        np.savez_compressed(path, __compact__=json.dumps(info), __meta__=json.dumps(self.meta), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            info = json.loads(str(data['__compact__']))
+            parts = {'breath': {}, 'residual_max': {}, 'residual_rms': {}}
+            for name in data.files:
+                if ':' in name:
+                    part, key = name.split(':', 1)
+                    parts[part][key] = data[name]
+            return cls(breath=parts['breath'], t_breath=data['t_breath'],
+                       breath_period=info['breath_period'], n_breaths=info['n_breaths'],
+                       residual_max=parts['residual_max'], residual_rms=parts['residual_rms'],
+                       meta=json.loads(str(data['__meta__'])))
+
+
+def save_traces(traces, path, compact=True, rtol=1e-3, pyramids=False):
+    """
+    Save traces, as one representative breath if the run is periodic within rtol.
+    TraceSet.load reads both formats.
+
+    With pyramids=True the min/max pyramids for zoomable plots (trace_pyramid.py)
+    are built now and saved next to the traces.
+
+    Returns:
+    bool: True if the traces were compacted.
+    """
+    compact_traces = CompactTraceSet.from_traces(traces, rtol) if compact else None
+    if compact_traces is None:
+        traces.save(path)
+    else:
+        compact_traces.save(path)
+
+    # Saved after the traces: stored_pyramids ignores pyramid files older than their traces
+    if pyramids:
+        from trace_pyramid import build_pyramids, save_pyramids, pyramid_path
+        save_pyramids(build_pyramids(traces), pyramid_path(path))
+    return compact_traces is not None
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def minmax_downsample(t, y, n_buckets):
+    """
+    Keep the minimum and maximum of every bucket (one bucket per pixel), in time order.
+    Peaks are kept exactly, so maximal pressures and stresses are drawn correctly.
+
+    Parameters:
+    t (ndarray): Time points.
+    y (ndarray): Signal values.
+    n_buckets (int): Number of buckets, normally the width of the axis in pixels.
+
+    Returns:
+    tuple: (t, y) with at most 2 * n_buckets + 2 points.
+    """
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return t, y
+
+    size = -(-n // n_buckets)
+    n_buckets = -(-n // size)
+    padded = np.concatenate([y, np.full(n_buckets * size - n, y[-1])]).reshape(n_buckets, size)
+    start = np.arange(n_buckets) * size
+    i_min = np.minimum(start + padded.argmin(axis=1), n - 1)
+    i_max = np.minimum(start + padded.argmax(axis=1), n - 1)
+
+    # First and last sample keep the line spanning the full time range
+    index = np.unique(np.concatenate([[0, n - 1], i_min, i_max]))
+    return t[index], y[index]
+
+
+def lttb(t, y, n_out, keep_extrema=True):
+    """
+    Largest-triangle-three-buckets downsampling: per bucket the point that forms the
+    largest triangle with the previously selected point and the mean of the next bucket.
+
+    Parameters:
+    t (ndarray): Time points.
+    y (ndarray): Signal values.
+    n_out (int): Number of points to keep.
+    keep_extrema (bool): Also keep the global minimum and maximum, which LTTB may skip.
+
+    Returns:
+    tuple: (t, y) downsampled.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return t, y
+
+    # n_out - 2 buckets between the first and last point
+    edges = np.unique(np.linspace(1, n - 1, n_out - 1).astype(int))
+    n_out = len(edges) + 1
+    sums_t = np.add.reduceat(t[:n - 1], edges[:-1])
+    sums_y = np.add.reduceat(y[:n - 1], edges[:-1])
+    counts = np.diff(edges)
+    mean_t = np.append(sums_t / counts, t[-1])
+    mean_y = np.append(sums_y / counts, y[-1])
+
+    index = np.empty(n_out, dtype=int)
+    index[0], index[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # Twice the triangle area with point a and the mean of the next bucket
+        area = np.abs((t[a] - mean_t[b + 1]) * (y[lo:hi] - y[a])
+                      - (t[a] - t[lo:hi]) * (mean_y[b + 1] - y[a]))
+        a = lo + int(np.argmax(area))
+        index[b + 1] = a
+
+    if keep_extrema:
+        index = np.unique(np.concatenate([index, [np.argmin(y), np.argmax(y)]]))
+    return t[index], y[index]
+
+
+def downsample(t, y, n_pixels, method='minmax'):
+    """
+    Reduce a time signal to what can be seen on an axis n_pixels wide.
+
+    Parameters:
+    method (str): 'minmax' (exact peaks, 2 points per pixel), 'lttb' (2 points per pixel)
+                  or None (no downsampling).
+    """
+    if method is None:
+        return t, y
+    if method == 'minmax':
+        return minmax_downsample(t, y, n_pixels)
+    if method == 'lttb':
+        return lttb(t, y, 2 * n_pixels)
+    raise ValueError(f"Unknown downsampling method '{method}'")
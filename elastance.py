@@ -0,0 +1,183 @@
+import numpy as np
+from heartrate import HeartRateTimeline
+
+VENTRICLES = ['cLv', 'cRv']
+
+# Minimal spread of the end-systolic points for an ESPVR regression [ml], [mmHg]
+ESPVR_MIN_SPREAD = (1.0, 1.0)
+# Physiologic range of the end-systolic elastance [mmHg/ml]
+EES_RANGE = (0.05, 10.0)
+
+
+def linear_fit(x, y, weights=None):
+    """
+    Least-squares line y = slope * x + intercept along the last axis, for a batch of
+    series at once. NaN points (or points with weight 0) are left out.
+
+    Returns:
+    tuple: (slope, intercept), shape x.shape[:-1].
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    w = np.isfinite(x) & np.isfinite(y)
+    w = w if weights is None else w * weights
+    x, y = np.where(w, x, 0), np.where(w, y, 0)
+    n = np.sum(w, axis=-1)
+    sx, sy = np.sum(w * x, axis=-1), np.sum(w * y, axis=-1)
+    sxx, sxy = np.sum(w * x * x, axis=-1), np.sum(w * x * y, axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+        intercept = (sy - slope * sx) / n
+    return slope, intercept
+
+
+def _segment_fit(x, y, mask, starts):
+    # Linear fit of y on x per beat over the masked samples, from reduceat sums
+    w = mask.astype(float)
+    x, y = np.where(mask, x, 0), np.where(mask, y, 0)
+    n, sx, sy, sxx, sxy = (np.add.reduceat(s, starts, axis=0) for s in (w, w * x, w * y, w * x * x, w * x * y))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = (n * sxy - sx * sy) / (n * sxx - sx ** 2)
+        intercept = (sy - slope * sx) / n
+    return slope, intercept
+
+
+def end_systolic_points(V, p, timeline, V0=0.0):
+    """
+    End-systolic point of every beat: the loop corner with the maximal p / (V - V0).
+
+    Parameters:
+    V, p (ndarray): Volumes [ml] and pressures [mmHg] (n x n_ventricles).
+    timeline (HeartRateTimeline): Beat boundaries.
+    V0 (float or ndarray): Volume intercept of the ESPVR (per ventricle).
+
+    Returns:
+    tuple: (ESV, ESP, E_max) per beat and ventricle, E_max = ESP / (ESV - V0) [mmHg/ml].
+    """
+    starts = timeline.beat_starts
+    with np.errstate(invalid='ignore', divide='ignore'):
+        elastance = np.where(V - V0 > 0, p / (V - V0), -np.inf)
+    E_max = np.maximum.reduceat(elastance, starts, axis=0)
+    corner = elastance == E_max[timeline.beat_of_sample]
+    # First corner sample of every beat
+    first = np.minimum.reduceat(np.where(corner, np.arange(len(V))[:, None], len(V)), starts, axis=0)
+    columns = np.arange(V.shape[1])
+    return V[first, columns], p[first, columns], E_max
+
+
+def end_diastolic_fit(V, p, timeline):
+    """
+    Exponential end-diastolic pressure-volume relation p = A exp(beta V) of every beat, fitted
+    (log-linear least squares) to the filling phase: from the minimal (diastolic) pressure of
+    the beat, after relaxation, up to end-diastole while the volume increases.
+
+    Returns:
+    tuple: (A [mmHg], beta [1/ml]) per beat and ventricle.
+    """
+    starts = timeline.beat_starts
+    p_min = np.minimum.reduceat(p, starts, axis=0)
+    at_min = (p == p_min[timeline.beat_of_sample]).astype(int)
+
+    # Samples after the pressure minimum of their own beat
+    seen = np.cumsum(at_min, axis=0)
+    before_beat = np.concatenate([np.zeros((1, V.shape[1]), dtype=int), seen[:-1]])[starts]
+    after_min = (seen - before_beat[timeline.beat_of_sample]) > 0
+
+    filling = after_min & (np.gradient(V, axis=0) > 0) & (p > 0)
+    log_p = np.log(np.where(p > 0, p, 1))
+    beta, log_A = _segment_fit(V, log_p, filling, starts)
+    return np.exp(log_A), beta
+
+
+def espvr_fit(ESV, ESP):
+    """
+    ESPVR p = Ees (V - V0) through the end-systolic points of many beats (beats along the
+    first axis, NaN points are left out). The regression is ill-conditioned when the beats
+    barely vary in load, so it is only used when the points spread at least ESPVR_MIN_SPREAD
+    and give an Ees within EES_RANGE and V0 above -ESV; otherwise V0 is fixed at 0 and Ees is
+    the median ESP / ESV. An Ees still outside EES_RANGE is returned as NaN.
+
+    Returns:
+    tuple: (Ees [mmHg/ml], V0 [ml]), shape ESV.shape[1:].
+    """
+    Ees, intercept = linear_fit(np.moveaxis(ESV, 0, -1), np.moveaxis(ESP, 0, -1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        V0 = -intercept / Ees
+        Ees_fixed = np.nanmedian(ESP / ESV, axis=0)
+    spread = ((np.nanmax(ESV, axis=0) - np.nanmin(ESV, axis=0) >= ESPVR_MIN_SPREAD[0])
+              & (np.nanmax(ESP, axis=0) - np.nanmin(ESP, axis=0) >= ESPVR_MIN_SPREAD[1]))
+    fitted = spread & (Ees >= EES_RANGE[0]) & (Ees <= EES_RANGE[1]) & (V0 > -np.nanmean(ESV, axis=0))
+    Ees = np.where(fitted, Ees, Ees_fixed)
+    V0 = np.where(fitted, V0, 0.0)
+    Ees = np.where((Ees >= EES_RANGE[0]) & (Ees <= EES_RANGE[1]), Ees, np.nan)
+    return Ees, V0
+
+
+def _elastance_points(traces, cycle_times, breath_cycle_time, iterations):
+    # End-systolic points (corner search with the V0 of the previous ESPVR fit) and EDPVR per beat
+    timeline = HeartRateTimeline.for_model(traces, cycle_times, breath_cycle_time)
+    V = traces['Cavity']['V'][:, VENTRICLES] * 1e6
+    p = traces['Cavity']['p'][:, VENTRICLES] * 7.5e-3
+
+    V0 = np.zeros(len(VENTRICLES))
+    for _ in range(iterations):
+        ESV, ESP, _ = end_systolic_points(V, p, timeline, V0)
+        _, V0 = espvr_fit(ESV, ESP)
+        V0 = np.minimum(V0, np.min(ESV, axis=0) - 1e-6)  # keep the corner search defined
+    ESV, ESP, E_max = end_systolic_points(V, p, timeline, V0)
+
+    A, beta = end_diastolic_fit(V, p, timeline)
+    return {'ESV': ESV, 'ESP': ESP, 'E_max': E_max, 'EDPVR_A': A, 'EDPVR_beta': beta}
+
+
+def estimate_elastance(traces, cycle_times, breath_cycle_time, iterations=3):
+    """
+    Contractility and stiffness of the LV and RV for every stored beat.
+
+    The ESPVR (p = Ees (V - V0)) is fitted through the end-systolic points of all beats
+    (which vary in load over the breath, see espvr_fit); the corners are then searched again
+    with the fitted V0, and Ees and V0 are fitted to the corners of the last search.
+
+    Parameters:
+    traces: Model or stored TraceSet that contains all the data.
+    cycle_times (list): List of cycle times for each beat.
+    breath_cycle_time (float): Length of one breathing cycle [s].
+    iterations (int): Number of corner search / ESPVR fit rounds.
+
+    Returns:
+    dict: Per beat (n_beats x 2, columns as VENTRICLES): 'ESV' [ml], 'ESP' [mmHg], 'E_max' [mmHg/ml]
+          (relative to the V0 of the corner search), 'EDPVR_A' [mmHg], 'EDPVR_beta' [1/ml];
+          per ventricle: 'Ees' [mmHg/ml] and 'V0' [ml] of one ESPVR line.
+    """
+    result = _elastance_points(traces, cycle_times, breath_cycle_time, iterations)
+    result['Ees'], result['V0'] = espvr_fit(result['ESV'], result['ESP'])
+    return result
+
+
+def batch_elastance(runs, iterations=3):
+    """
+    Elastance indices of many stored runs: the corners are searched per run, the ESPVR is
+    fitted across the beats of all runs in one batched call.
+
+    Parameters:
+    runs (list): TraceSets (with the trigger schedule in their meta data).
+    iterations (int): Number of corner search / ESPVR fit rounds, see estimate_elastance.
+
+    Returns:
+    dict: As estimate_elastance, with the per-beat arrays padded with NaN to the longest run
+          (n_runs x n_beats x 2), and 'Ees', 'V0' and 'EDPVR_beta_median' per run (n_runs x 2).
+    """
+    results = [_elastance_points(traces, traces.cycle_times, traces.breath_cycle_time, iterations)
+               for traces in runs]
+    n_beats = max(len(result['ESV']) for result in results)
+
+    def padded(name):
+        out = np.full((len(results), n_beats, len(VENTRICLES)), np.nan)
+        for i, result in enumerate(results):
+            out[i, :len(result[name])] = result[name]
+        return out
+
+    batch = {name: padded(name) for name in ('ESV', 'ESP', 'E_max', 'EDPVR_A', 'EDPVR_beta')}
+    batch['Ees'], batch['V0'] = espvr_fit(np.moveaxis(batch['ESV'], 1, 0), np.moveaxis(batch['ESP'], 1, 0))
+    batch['EDPVR_beta_median'] = np.nanmedian(batch['EDPVR_beta'], axis=1)
+    return batch
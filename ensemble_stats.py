@@ -0,0 +1,203 @@
+import numpy as np
+
+
+class RunningMoments:
+    def __init__(self, shape):
+        """
+        Streaming count, mean, variance, minimum and maximum of every cell of an array
+        (Welford updates, merged with the parallel formula of Chan et al.). NaN values are
+        skipped, so every cell keeps its own count.
+
+        Parameters:
+        shape (tuple): Shape of one observation, e.g. (n_beats, n_metrics).
+        """
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.M2 = np.zeros(shape)  # sum of squared deviations from the mean
+        self.min = np.full(shape, np.inf)
+        self.max = np.full(shape, -np.inf)
+
+    def add(self, values, index=()):
+        """
+        Add one observation (shape) or a batch of observations (n x shape).
+
+        Parameters:
+        values (ndarray): Observation(s), shaped like the cells selected by index.
+        index (int or tuple, optional): Only update these cells, e.g. one condition (first axis).
+        """
+        shape = self.mean[index].shape
+        values = np.asarray(values, dtype=float).reshape((-1,) + shape)
+        valid = ~np.isnan(values)
+        count = valid.sum(axis=0)
+        total = np.where(valid, values, 0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, 0)
+        M2 = np.where(valid, (values - mean) ** 2, 0).sum(axis=0)
+        self._combine(count, mean, M2, index)
+        self.min[index] = np.minimum(self.min[index], np.where(valid, values, np.inf).min(axis=0))
+        self.max[index] = np.maximum(self.max[index], np.where(valid, values, -np.inf).max(axis=0))
+
+    def merge(self, other):
+        """
+        Add the observations of another RunningMoments (e.g. from a worker process).
+        """
+        self._combine(other.count, other.mean, other.M2)
+        self.min = np.minimum(self.min, other.min)
+        self.max = np.maximum(self.max, other.max)
+        return self
+
+    def _combine(self, count, mean, M2, index=()):
+        old_count, old_mean = self.count[index], self.mean[index]
+        total = old_count + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean - old_mean
+            self.mean[index] = np.where(total > 0, old_mean + delta * count / total, 0)
+            self.M2[index] = np.where(total > 0, self.M2[index] + M2 + delta ** 2 * old_count * count / total, 0)
+        self.count[index] = total
+
+    @property
+    def var(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, self.M2 / self.count, np.nan)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+
+class HistogramSketch:
+    def __init__(self, low, high, shape, n_bins=200):
+        """
+        Quantile sketch with fixed bin edges: a histogram per cell, so memory does not
+        grow with the number of observations and sketches merge by adding the counts.
+
+        Parameters:
+        low, high (float or ndarray): Range of the bins (per cell if arrays of shape); values
+                                      outside the range are counted in the first or last bin.
+        shape (tuple): Shape of one observation.
+        n_bins (int): Number of bins; the quantile error is at most one bin width.
+        """
+        self.shape = tuple(shape)
+        self.low = np.broadcast_to(np.asarray(low, dtype=float), self.shape)
+        self.high = np.broadcast_to(np.asarray(high, dtype=float), self.shape)
+        self.n_bins = n_bins
+        self.counts = np.zeros(self.shape + (n_bins,), dtype=np.int64)
+
+    def add(self, values, index=()):
+        """
+        Add one observation (shape) or a batch of observations (n x shape), NaN values are skipped.
+
+        Parameters:
+        values (ndarray): Observation(s), shaped like the cells selected by index.
+        index (int or tuple, optional): Only update these cells, e.g. one condition (first axis).
+        """
+        counts = self.counts[index]
+        shape = counts.shape[:-1]
+        low, high = self.low[index], self.high[index]
+        values = np.asarray(values, dtype=float).reshape((-1,) + shape)
+        valid = ~np.isnan(values)
+        position = (values - low) / (high - low) * self.n_bins
+        bins = np.clip(np.where(valid, position, 0).astype(int), 0, self.n_bins - 1)
+        cell = np.broadcast_to(np.arange(int(np.prod(shape))).reshape(shape), values.shape)
+        key = (cell * self.n_bins + bins)[valid]
+        flat = counts.reshape(-1)
+        np.add.at(flat, key, 1)
+        if not np.shares_memory(flat, self.counts):  # selection that is not a contiguous view
+            self.counts[index] = flat.reshape(counts.shape)
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def quantile(self, q):
+        """
+        Parameters:
+        q (float or list): Quantile(s) between 0 and 1.
+
+        Returns:
+        ndarray: Quantiles (len(q) x shape, or shape for one q), linearly interpolated within
+                 the bin; NaN for cells without observations.
+        """
+        q = np.atleast_1d(q)
+        counts = self.counts.reshape(-1, self.n_bins)
+        cumulative = np.cumsum(counts, axis=1)
+        total = cumulative[:, -1]
+        cells = np.arange(len(counts))
+
+        target = q[:, None] * total  # (n_q, n_cells)
+        bins = np.minimum(np.sum(cumulative < target[..., None], axis=-1), self.n_bins - 1)
+        below = (cumulative - counts)[cells, bins]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.clip((target - below) / counts[cells, bins], 0, 1)
+        width = ((self.high - self.low) / self.n_bins).ravel()
+        result = np.where(total > 0, self.low.ravel() + (bins + fraction) * width, np.nan)
+        result = result.reshape((len(q),) + self.shape)
+        return result if len(q) > 1 else result[0]
+
+
+class EnsembleAggregator:
+    def __init__(self, conditions, n_beats, ranges, n_bins=200):
+        """
+        Constant-memory statistics of per-beat metrics over a cohort of runs, per condition,
+        beat and metric. Runs are added as they finish; aggregators of worker processes merge.
+
+        Usage:
+            aggregator = EnsembleAggregator(['Healthy', 'HFrEF', 'HFpEF'], n_beats,
+                                            {'aortic_CO': (0, 10), 'LA_stress': (0, 30)})
+            aggregator.add('HFrEF', compute_metrics(traces))
+            summary = aggregator.summary()
+
+        Parameters:
+        conditions (list): Names of the conditions (groups).
+        n_beats (int): Number of beats per run; longer metric arrays are cut, shorter ones padded.
+        ranges (dict): Metric name -> (low, high) range of the quantile sketch.
+        n_bins (int): Number of bins of the quantile sketch.
+        """
+        self.conditions = list(conditions)
+        self.metrics = list(ranges)
+        self.n_beats = n_beats
+        shape = (len(self.conditions), n_beats, len(self.metrics))
+        low = np.array([ranges[name][0] for name in self.metrics])
+        high = np.array([ranges[name][1] for name in self.metrics])
+        self.moments = RunningMoments(shape)
+        self.sketch = HistogramSketch(np.broadcast_to(low, shape), np.broadcast_to(high, shape), shape, n_bins)
+
+    def add(self, condition, metrics):
+        """
+        Add the per-beat metrics of one run (dict metric name -> array per beat, e.g. compute_metrics).
+        """
+        # Only the cells of this condition are updated
+        observation = np.full((self.n_beats, len(self.metrics)), np.nan)
+        for k, name in enumerate(self.metrics):
+            values = np.asarray(metrics[name], dtype=float)[:self.n_beats]
+            observation[:len(values), k] = values
+        i = self.conditions.index(condition)
+        self.moments.add(observation, i)
+        self.sketch.add(observation, i)
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def summary(self, quantiles=(0.05, 0.5, 0.95)):
+        """
+        Returns:
+        dict: Condition -> metric -> dict with 'count', 'mean', 'std', 'min', 'max' and one entry
+              per quantile (e.g. 'q50'), every value an array per beat.
+        """
+        q = self.sketch.quantile(list(quantiles)).reshape((len(quantiles),) + self.moments.mean.shape)
+        empty = self.moments.count == 0
+        mean = np.where(empty, np.nan, self.moments.mean)
+        low = np.where(empty, np.nan, self.moments.min)
+        high = np.where(empty, np.nan, self.moments.max)
+        summary = {}
+        for i, condition in enumerate(self.conditions):
+            summary[condition] = {}
+            for k, name in enumerate(self.metrics):
+                stats = {'count': self.moments.count[i, :, k], 'mean': mean[i, :, k],
+                         'std': self.moments.std[i, :, k], 'min': low[i, :, k], 'max': high[i, :, k]}
+                for j, quantile in enumerate(quantiles):
+                    stats[f'q{100 * quantile:g}'] = q[j, i, :, k]
+                summary[condition][name] = stats
+        return summary
@@ -40,4 +40,89 @@ def calculate_networktriggers(n_beats, t_cycle, mean, delta_hr, breathing_ratios
         
     return cycle_times
 
+def beat_start_indices(time_points, cycle_times, breath_cycle_time):
+    """
+    Sample indices at which every stored beat starts, following the trigger schedule
+    np.cumsum(cycle_times[0:-1]) that is repeated every breath.
+
+    Parameters:
+    time_points (ndarray): Stored time points (model['Solver']['t']).
+    cycle_times (list): List of cycle times for each beat (first value 0).
+    breath_cycle_time (float): Length of one breathing cycle [s].
+
+    Returns:
+    tuple: (start_indices, beat_in_breath, breath_index) arrays with one value per beat.
+    """
+    time_points = np.asarray(time_points)
+    t = time_points - time_points[0]
+    dt = (t[-1] - t[0]) / max(len(t) - 1, 1)
+    trigger_times = np.cumsum(cycle_times[0:-1])
+
+    n_breaths = int(np.ceil((t[-1] + dt) / breath_cycle_time))
+    start_times = np.arange(n_breaths)[:, None] * breath_cycle_time + trigger_times[None, :]
+    beat_in_breath = np.broadcast_to(np.arange(len(trigger_times)), start_times.shape).ravel()
+    breath_index = np.broadcast_to(np.arange(n_breaths)[:, None], start_times.shape).ravel()
+    start_times = start_times.ravel()
+
+    stored = start_times < t[-1]
+    start_indices = np.searchsorted(t, start_times[stored] - dt / 2)
+    return start_indices, beat_in_breath[stored], breath_index[stored]
+
+
+class HeartRateTimeline:
+    def __init__(self, time_points, cycle_times, breath_cycle_time):
+        """
+        Heart rate of every stored beat and sample, built once from the trigger schedule
+        and the stored time axis, so plots and analyses do not have to re-derive it.
+
+        Parameters:
+        time_points (ndarray): Stored time points (model['Solver']['t']).
+        cycle_times (list): List of cycle times for each beat (first value 0).
+        breath_cycle_time (float): Length of one breathing cycle [s].
+        """
+        self.time_points = np.asarray(time_points)
+        n_samples = len(self.time_points)
+
+        self.beat_starts, self.beat_in_breath, self.breath_index = beat_start_indices(
+            self.time_points, cycle_times, breath_cycle_time)
+        self.beat_ends = np.append(self.beat_starts[1:], n_samples)  # exclusive
+        self.cycle_times = np.asarray(cycle_times[1:], dtype=float)[self.beat_in_breath]
+        self.hr_per_beat = 60 / self.cycle_times  # bpm
+
+        # Beat number of every sample (samples before the first trigger belong to the first beat)
+        self.beat_of_sample = np.clip(np.searchsorted(self.beat_starts, np.arange(n_samples), side='right') - 1,
+                                      0, None)
+        self.hr_per_sample = self.hr_per_beat[self.beat_of_sample]
+
+    @classmethod
+    def for_model(cls, model, cycle_times, breath_cycle_time):
+        """
+        Timeline of a model or TraceSet; for a TraceSet it is kept in traces.cache.
+        """
+        cache = getattr(model, 'cache', None)
+        key = ('timeline', tuple(cycle_times), breath_cycle_time)
+        if cache is not None and key in cache:
+            return cache[key]
+        timeline = cls(model['Solver']['t'], cycle_times, breath_cycle_time)
+        if cache is not None:
+            cache[key] = timeline
+        return timeline
+
+    @property
+    def n_beats(self):
+        return len(self.beat_starts)
+
+    @property
+    def beat_start_times(self):
+        return self.time_points[self.beat_starts]
+
+    def step_data(self):
+        """
+        Returns:
+        tuple: (time points [ms], heart rate [bpm]) for a step plot with where='post'.
+        """
+        times = np.append(self.beat_start_times, self.time_points[-1]) * 1e3
+        return times, np.append(self.hr_per_beat, self.hr_per_beat[-1])
+
+
 cycle_times = calculate_networktriggers(5, 0.8, 75, 12, [0.375,0.375,0.25])
\ No newline at end of file
@@ -0,0 +1,80 @@
+import numpy as np
+from cardiac_calculations import calculate_stroke_work
+from heartrate import HeartRateTimeline
+from trace_store import PATCHES
+
+# Chambers with a pressure-volume loop
+CHAMBERS = ['Ra', 'cRv', 'La', 'cLv']
+
+
+def compute_indices(traces, cycle_times, breath_cycle_time):
+    """
+    Calculate the hemodynamic indices of every stored beat and chamber in one pass: all
+    signals are stacked and reduced per beat together (np.*.reduceat on the beat starts).
+
+    Parameters:
+    traces: Model or stored TraceSet that contains all the data.
+    cycle_times (list): List of cycle times for each beat.
+    breath_cycle_time (float): Length of one breathing cycle [s].
+
+    Returns:
+    dict: Arrays of n_beats x len(CHAMBERS) (columns as CHAMBERS):
+          'EDV', 'ESV', 'SV' [ml], 'EF' [-], 'p_max', 'p_mean' [mmHg], 'dpdt_max', 'dpdt_min' [mmHg/s],
+          'stroke_work' [J], 'tau' [ms], 'p_tm_max', 'p_tm_mean' [mmHg] (transmural, against Thorax.p),
+          and 'Sf_max' [kPa], n_beats x len(PATCHES) (columns as PATCHES).
+    """
+    timeline = HeartRateTimeline.for_model(traces, cycle_times, breath_cycle_time)
+    t = timeline.time_points
+    starts = timeline.beat_starts
+    n_samples = len(t)
+    n = len(CHAMBERS)
+
+    V = traces['Cavity']['V'][:, CHAMBERS] * 1e6  # ml
+    p = traces['Cavity']['p'][:, CHAMBERS] * 7.5e-3  # mmHg
+    p_thorax = traces['Thorax']['p'][:, 0] * 7.5e-3
+    Sf = traces['Patch']['Sf'][:, PATCHES] * 1e-3  # kPa
+    dpdt = np.gradient(p, t, axis=0)
+
+    # One stacked array, reduced per beat at once
+    stacked = np.column_stack([V, p, dpdt, p - p_thorax[:, None], Sf])
+    blocks = {'V': slice(0, n), 'p': slice(n, 2 * n), 'dpdt': slice(2 * n, 3 * n),
+              'p_tm': slice(3 * n, 4 * n), 'Sf': slice(4 * n, None)}
+    maxima = np.maximum.reduceat(stacked, starts, axis=0)
+    minima = np.minimum.reduceat(stacked, starts, axis=0)
+    means = np.add.reduceat(stacked, starts, axis=0) / np.diff(np.append(starts, n_samples))[:, None]
+
+    EDV, ESV = maxima[:, blocks['V']], minima[:, blocks['V']]
+    dpdt_min = minima[:, blocks['dpdt']]
+
+    # Tau of relaxation (zero-asymptote approximation): -p / (dP/dt) at the minimum dP/dt
+    at_min = dpdt == dpdt_min[timeline.beat_of_sample]
+    p_at_min = np.maximum.reduceat(np.where(at_min, p, -np.inf), starts, axis=0)
+    tau = -p_at_min / dpdt_min * 1e3
+
+    # Stroke work: shoelace area of every loop, closed at the next beat start
+    area = calculate_stroke_work(V, p, starts)
+
+    return {
+        'EDV': EDV,
+        'ESV': ESV,
+        'SV': EDV - ESV,
+        'EF': (EDV - ESV) / EDV,
+        'p_max': maxima[:, blocks['p']],
+        'p_mean': means[:, blocks['p']],
+        'dpdt_max': maxima[:, blocks['dpdt']],
+        'dpdt_min': dpdt_min,
+        'stroke_work': area * 133.322e-6,  # 1 ml*mmHg = 133.322e-6 J
+        'tau': tau,
+        'p_tm_max': maxima[:, blocks['p_tm']],
+        'p_tm_mean': means[:, blocks['p_tm']],
+        'Sf_max': maxima[:, blocks['Sf']],
+    }
+
+
+def chamber_index(indices, name, chamber):
+    """
+    Returns:
+    ndarray: One index per beat of one chamber (or patch for 'Sf_max'), e.g. chamber_index(indices, 'EF', 'cLv').
+    """
+    columns = PATCHES if name == 'Sf_max' else CHAMBERS
+    return indices[name][:, columns.index(chamber)]
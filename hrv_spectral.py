@@ -0,0 +1,207 @@
+import numpy as np
+from heartrate import HeartRateTimeline
+from cardiac_calculations import calculate_CO_per_beat
+
+# Standard HRV frequency bands [Hz]
+LF_BAND = (0.04, 0.15)
+HF_BAND = (0.15, 0.4)
+
+
+def lomb_scargle(times, values, frequencies):
+    """
+    Lomb-Scargle periodogram of unevenly sampled series (e.g. RR intervals at the beat
+    times), for a batch of series at once.
+
+    Parameters:
+    times (ndarray): Sample times [s] (n) or (n_runs x n).
+    values (ndarray): Values at these times, same shape.
+    frequencies (ndarray): Frequencies [Hz] (n_f).
+
+    Returns:
+    tuple: (power (... x n_f), complex amplitude (... x n_f)). The power is the classical
+           periodogram divided by n (values^2, A^2 / 4 for a sinusoid of amplitude A), the
+           complex amplitude c gives the fitted sinusoid Re(c exp(2 pi i f t)).
+    """
+    t = np.asarray(times, dtype=float)[..., None, :]
+    y = np.asarray(values, dtype=float)
+    y = (y - y.mean(axis=-1, keepdims=True))[..., None, :]
+    omega = 2 * np.pi * np.asarray(frequencies, dtype=float)[:, None]
+
+    # Time shift tau makes the sine and cosine terms orthogonal
+    tau = np.arctan2(np.sum(np.sin(2 * omega * t), axis=-1),
+                     np.sum(np.cos(2 * omega * t), axis=-1)) / (2 * omega[:, 0])
+    arg = omega * (t - tau[..., None])
+    cos, sin = np.cos(arg), np.sin(arg)
+    cc, ss = np.sum(cos ** 2, axis=-1), np.sum(sin ** 2, axis=-1)
+    a = np.sum(y * cos, axis=-1) / cc
+    b = np.sum(y * sin, axis=-1) / ss
+
+    n = t.shape[-1]
+    power = 0.5 * (a ** 2 * cc + b ** 2 * ss) / n
+    amplitude = (a - 1j * b) * np.exp(-1j * omega[:, 0] * tau)
+    return power, amplitude
+
+
+def uniform_resample(times, values, fs, duration=None):
+    """
+    Resample a batch of unevenly sampled series onto one uniform time grid with a single
+    np.interp call (every series is shifted to its own time range).
+
+    Parameters:
+    times (ndarray): Sample times [s] (n_runs x n), increasing per row.
+    values (ndarray): Values at these times, same shape.
+    fs (float): Sampling frequency of the grid [Hz].
+    duration (float, optional): Length of the grid [s] (default: shortest series).
+
+    Returns:
+    tuple: (grid (n_grid), resampled values (n_runs x n_grid))
+    """
+    times = np.atleast_2d(np.asarray(times, dtype=float))
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    times = times - times[:, :1]
+    duration = duration or np.min(times[:, -1])
+    grid = np.arange(0, duration, 1 / fs)
+
+    offset = (np.max(times) + 1) * np.arange(len(times))[:, None]
+    resampled = np.interp((grid + offset).ravel(), (times + offset).ravel(), values.ravel())
+    return grid, resampled.reshape(len(times), len(grid))
+
+
+def welch(x, fs, segment_length):
+    """
+    Welch power spectral density of a batch of evenly sampled series (half-overlapping
+    Hann-windowed segments).
+
+    Returns:
+    tuple: (frequencies [Hz], one-sided PSD (... x n_f) in units of x^2 / Hz)
+    """
+    x = np.asarray(x, dtype=float)
+    n = x.shape[-1]
+    segment_length = min(segment_length, n)
+    starts = np.arange(0, n - segment_length + 1, segment_length // 2)
+    window = np.hanning(segment_length)
+    segments = x[..., starts[:, None] + np.arange(segment_length)]
+    segments = (segments - segments.mean(axis=-1, keepdims=True)) * window
+    psd = np.mean(np.abs(np.fft.rfft(segments, axis=-1)) ** 2, axis=-2) / (fs * np.sum(window ** 2))
+    psd[..., 1:] *= 2
+    if segment_length % 2 == 0:
+        psd[..., -1] /= 2
+    return np.fft.rfftfreq(segment_length, 1 / fs), psd
+
+
+def band_power(frequencies, psd, band):
+    """
+    Power of a PSD within a frequency band (trapezoid integral).
+    """
+    inside = (frequencies >= band[0]) & (frequencies < band[1])
+    return np.trapezoid(psd[..., inside], frequencies[inside], axis=-1)
+
+
+def hrv_spectrum(times, rr, breath_cycle_time, output=None, method='lomb', fs=4.0, n_frequencies=200):
+    """
+    Spectral HRV analysis of one or a batch of runs.
+
+    Parameters:
+    times (ndarray): Beat times [s] (n) or (n_runs x n).
+    rr (ndarray): RR intervals [s] of these beats, same shape.
+    breath_cycle_time (float): Length of one breathing cycle [s]; the respiratory peak is
+                               searched around 1 / breath_cycle_time.
+    output (ndarray, optional): Per-beat CO or SV of the same beats, for the transfer gain from HR.
+    method (str): 'lomb' (Lomb-Scargle on the beat times) or 'welch' (Welch on the series
+                  resampled at fs).
+    fs (float): Resampling frequency for 'welch' [Hz].
+    n_frequencies (int): Minimal number of frequencies for 'lomb' (up to HF_BAND[1]); the grid is
+                         refined to at least four points per 1 / record length.
+
+    Returns:
+    dict: 'frequencies', 'psd' (RR, ms^2/Hz), 'LF', 'HF' [ms^2], 'LF/HF', 'respiratory_frequency' [Hz],
+          'respiratory_amplitude' (RR amplitude at the breathing frequency [ms]) and, with output,
+          'transfer_gain' (output amplitude per bpm) and 'transfer_phase' [rad] at the respiratory frequency.
+    """
+    times = np.asarray(times, dtype=float)
+    rr_ms = np.asarray(rr, dtype=float) * 1e3
+    hr = 60 / np.asarray(rr, dtype=float)
+
+    if method == 'lomb':
+        span = times[..., -1:] - times[..., :1]
+        n = times.shape[-1]
+        n_frequencies = max(n_frequencies, int(4 * HF_BAND[1] * np.max(span)))
+        frequencies = np.linspace(1 / np.min(span), HF_BAND[1], n_frequencies)
+        power, _ = lomb_scargle(times, rr_ms, frequencies)
+        # One-sided density: 2 T / N times the classical periodogram (n * power), with the
+        # record length T = N * mean interval, so the integral over f is the variance
+        psd = 2 * power * span * n / (n - 1)
+    elif method == 'welch':
+        grid, resampled = uniform_resample(np.atleast_2d(times), np.atleast_2d(rr_ms), fs)
+        frequencies, psd = welch(resampled, fs, len(grid) // 2)  # three half-overlapping segments
+        psd = psd.reshape(rr_ms.shape[:-1] + psd.shape[-1:])
+    else:
+        raise ValueError(f"Unknown spectral method '{method}'")
+
+    LF = band_power(frequencies, psd, LF_BAND)
+    HF = band_power(frequencies, psd, HF_BAND)
+
+    # Respiratory peak: largest PSD within 20 % of the breathing frequency
+    f_breath = 1 / breath_cycle_time
+    near = np.abs(frequencies - f_breath) <= 0.2 * f_breath
+    if not near.any():  # breathing frequency off the grid: take the closest frequency
+        near = np.arange(len(frequencies)) == np.argmin(np.abs(frequencies - f_breath))
+    peak = np.flatnonzero(near)[np.argmax(psd[..., near], axis=-1)]
+    _, rr_fit = lomb_scargle(times, rr_ms, [f_breath])
+
+    result = {
+        'frequencies': frequencies,
+        'psd': psd,
+        'LF': LF,
+        'HF': HF,
+        'LF/HF': LF / HF,
+        'respiratory_frequency': frequencies[peak],
+        'respiratory_amplitude': np.abs(rr_fit[..., 0]),
+    }
+    if output is not None:
+        # Transfer function HR -> output from the fitted sinusoids at the breathing frequency
+        _, hr_fit = lomb_scargle(times, hr, [f_breath])
+        _, output_fit = lomb_scargle(times, output, [f_breath])
+        transfer = output_fit[..., 0] / hr_fit[..., 0]
+        result['transfer_gain'] = np.abs(transfer)
+        result['transfer_phase'] = np.angle(transfer)
+    return result
+
+
+def schedule_series(cycle_times, n_breaths):
+    """
+    Beat times and RR intervals of a trigger schedule (e.g. from calculate_networktriggers),
+    to check its spectral content before simulating.
+
+    Returns:
+    tuple: (beat times [s], RR intervals [s])
+    """
+    rr = np.tile(np.asarray(cycle_times[1:], dtype=float), n_breaths)
+    return np.concatenate([[0], np.cumsum(rr[:-1])]), rr
+
+
+def ensemble_hrv(runs, method='lomb', output='CO'):
+    """
+    HRV spectra of an ensemble of stored runs in one batched call. All runs are cut to
+    the number of beats of the shortest run.
+
+    Parameters:
+    runs (list): Stored TraceSets; the trigger schedule is read from their meta data
+                 (cycle_times, breath_cycle_time), so plain models are not accepted.
+    method (str): 'lomb' or 'welch', see hrv_spectrum.
+    output (str): 'CO' (aortic CO per beat) or None.
+
+    Returns:
+    dict: As hrv_spectrum, one value (or spectrum) per run.
+    """
+    timelines = [HeartRateTimeline.for_model(traces, traces.cycle_times, traces.breath_cycle_time)
+                 for traces in runs]
+    n = min(timeline.n_beats for timeline in timelines)
+    times = np.array([timeline.beat_start_times[:n] for timeline in timelines])
+    rr = np.array([timeline.cycle_times[:n] for timeline in timelines])
+    CO = None
+    if output == 'CO':
+        CO = np.array([calculate_CO_per_beat(traces['Valve']['q'][:, 'LvSyArt'], timeline)[:n]
+                       for traces, timeline in zip(runs, timelines)])
+    breath_cycle_time = np.mean([traces.breath_cycle_time for traces in runs])
+    return hrv_spectrum(times, rr, breath_cycle_time, CO, method)
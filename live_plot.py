@@ -0,0 +1,219 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from cardiac_calculations import calculate_CO_per_beat
+from heartrate import HeartRateTimeline
+
+
+class RingBuffer:
+    def __init__(self, capacity, n_columns):
+        """
+        Fixed size buffer of the most recent samples (capacity x n_columns).
+        """
+        self.data = np.full((capacity, n_columns), np.nan)
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # index where the next sample is written
+
+    def append(self, samples):
+        samples = np.asarray(samples, dtype=float)[-self.capacity:]
+        n = len(samples)
+        first = min(n, self.capacity - self.head)
+        self.data[self.head:self.head + first] = samples[:first]
+        self.data[:n - first] = samples[first:]
+        self.head = (self.head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def view(self):
+        """
+        Returns:
+        ndarray: The stored samples, oldest first.
+        """
+        if self.size < self.capacity:
+            return self.data[:self.size]
+        return np.concatenate([self.data[self.head:], self.data[:self.head]])
+
+
+# Live signals: (panel, label, component, variable, name, scale, color)
+LIVE_SIGNALS = [
+    ('pressure', 'LV', 'Cavity', 'p', 'cLv', 1 / 133, 'red'),
+    ('pressure', 'AO', 'Cavity', 'p', 'SyArt', 1 / 133, 'orange'),
+    ('pressure', 'RV', 'Cavity', 'p', 'cRv', 1 / 133, '#00008B'),
+    ('volume', 'LV', 'Cavity', 'V', 'cLv', 1e6, 'red'),
+    ('volume', 'RV', 'Cavity', 'V', 'cRv', 1e6, '#00008B'),
+    ('thorax', None, 'Thorax', 'p', 0, 7.5e-3, 'blue'),
+]
+
+
+def diverged(samples):
+    """
+    Default divergence check on the samples of the last breath (columns as LIVE_SIGNALS,
+    already scaled): non-finite values, negative volumes or pressures above 300 mmHg.
+    """
+    pressure = samples[:, [i for i, s in enumerate(LIVE_SIGNALS) if s[0] == 'pressure']]
+    volume = samples[:, [i for i, s in enumerate(LIVE_SIGNALS) if s[0] == 'volume']]
+    return bool(not np.all(np.isfinite(samples)) or np.any(volume < 0) or np.any(pressure > 300))
+
+
+class LiveSimulationPlot:
+    def __init__(self, model, cycle_times, n_beats, breath_cycle_time, window=20.0):
+        """
+        Run the model breath by breath and show the pressures, volumes, thorax pressure and
+        the CO per beat of the last breath while it is running, using blitting.
+
+        Parameters:
+        model: Model, set up (triggers, thorax) and stabilised as in the simulation scripts.
+        cycle_times (list): List of cycle times for each beat.
+        n_beats (int): Number of heartbeats per breath.
+        breath_cycle_time (float): Length of one breathing cycle [s].
+        window (float): Length of the shown time window [s]; only these samples are kept.
+        """
+        self.model = model
+        self.cycle_times = cycle_times
+        self.n_beats = n_beats
+        self.breath_cycle_time = breath_cycle_time
+        self.window = window
+        self.buffer = None
+        self.time_buffer = None
+
+        self.fig, axes = plt.subplots(2, 2, figsize=(10, 7))
+        self.axes = {'pressure': axes[0, 0], 'volume': axes[1, 0], 'thorax': axes[0, 1], 'CO': axes[1, 1]}
+        self.lines = []
+        for panel, label, _, _, _, _, color in LIVE_SIGNALS:
+            line, = self.axes[panel].plot([], [], label=label, color=color, animated=True)
+            self.lines.append(line)
+
+        for panel, ylim, ylabel in [('pressure', (0, 150), 'Pressure [mmHg]'),
+                                    ('volume', (0, 250), 'Volume [ml]'),
+                                    ('thorax', (-3, 1), 'Pressure [mmHg]')]:
+            ax = self.axes[panel]
+            ax.set_xlim(0, window * 1e3)
+            ax.set_ylim(*ylim)
+            ax.set_xlabel('Time [ms]')
+            ax.set_ylabel(ylabel)
+        self.axes['pressure'].legend(ncol=3, loc='upper right')
+        self.axes['volume'].legend(ncol=2, loc='upper right')
+        self.axes['thorax'].set_title('Thorax Pressure', fontweight='bold')
+
+        index = np.arange(1, n_beats + 1)
+        self.bars = {
+            'aortic': self.axes['CO'].bar(index - 0.2, np.zeros(n_beats), 0.4, label='Aorta', color='red'),
+            'pulmonary': self.axes['CO'].bar(index + 0.2, np.zeros(n_beats), 0.4, label='Pulmonary', color='#00008B'),
+        }
+        for bars in self.bars.values():
+            for bar in bars:
+                bar.set_animated(True)
+        self.axes['CO'].set_ylim(0, 8)
+        self.axes['CO'].set_xticks(index)
+        self.axes['CO'].set_xlabel('Beat Number')
+        self.axes['CO'].set_ylabel('Cardiac Output (L/min)')
+        self.axes['CO'].legend(loc='upper right')
+        self.title = self.axes['CO'].set_title('CO - last breath', fontweight='bold', animated=True)
+
+        self.fig.tight_layout()
+        self._background = None
+
+    def _artists(self):
+        return self.lines + list(self.bars['aortic']) + list(self.bars['pulmonary']) + [self.title]
+
+    def _redraw_background(self):
+        self.fig.canvas.draw()
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def _blit(self):
+        canvas = self.fig.canvas
+        if not canvas.supports_blit:
+            canvas.draw()
+            return
+        if self._background is None:
+            self._redraw_background()
+        canvas.restore_region(self._background)
+        for artist in self._artists():
+            self.fig.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    def _breath_samples(self):
+        samples = [self.model[component][var][:, name] * scale
+                   for _, _, component, var, name, scale, _ in LIVE_SIGNALS]
+        return np.column_stack(samples)
+
+    def run(self, n_breaths, abort=diverged):
+        """
+        Run n_breaths breaths, one model.run(1) at a time, and update the plot after each.
+
+        Parameters:
+        n_breaths (int): Number of breaths to simulate.
+        abort (callable, optional): Function (samples of the last breath) -> bool; the run stops
+                                    when it returns True. Default: diverged.
+
+        Returns:
+        dict: 'aortic_CO' and 'pulmonary_CO' arrays (breaths x beats) and 'aborted' (bool).
+        """
+        store_beats = self.model['Solver']['store_beats']
+        self.model['Solver']['store_beats'] = 1
+        try:
+            results = {'aortic_CO': [], 'pulmonary_CO': [], 'aborted': False}
+            plt.show(block=False)
+            elapsed = 0.0
+
+            for breath in range(n_breaths):
+                self.model.run(1)
+                t = np.asarray(self.model['Solver']['t'])
+                samples = self._breath_samples()
+                if self.buffer is None:
+                    dt = (t[-1] - t[0]) / max(len(t) - 1, 1)
+                    capacity = int(np.ceil(self.window / dt))
+                    self.buffer = RingBuffer(capacity, samples.shape[1])
+                    self.time_buffer = RingBuffer(capacity, 1)
+                self.buffer.append(samples)
+                self.time_buffer.append((t - t[0] + elapsed)[:, None])
+                elapsed += self.breath_cycle_time
+
+                timeline = HeartRateTimeline(t, self.cycle_times, self.breath_cycle_time)
+                aortic_CO = calculate_CO_per_beat(self.model['Valve']['q'][:, 'LvSyArt'], timeline)[:self.n_beats]
+                pulmonary_CO = calculate_CO_per_beat(self.model['Valve']['q'][:, 'RvPuArt'], timeline)[:self.n_beats]
+                results['aortic_CO'].append(aortic_CO)
+                results['pulmonary_CO'].append(pulmonary_CO)
+
+                self._update(aortic_CO, pulmonary_CO, breath)
+                if abort is not None and abort(samples):
+                    results['aborted'] = True
+                    self.title.set_text(f'Aborted after breath {breath + 1}')
+                    self._blit()
+                    break
+        finally:
+            self.model['Solver']['store_beats'] = store_beats  # leave the caller's model as it was
+
+        results['aortic_CO'] = np.array(results['aortic_CO'])
+        results['pulmonary_CO'] = np.array(results['pulmonary_CO'])
+        return results
+
+    def _update(self, aortic_CO, pulmonary_CO, breath):
+        t_ms = self.time_buffer.view()[:, 0] * 1e3
+        data = self.buffer.view()
+        for line, y in zip(self.lines, data.T):
+            line.set_data(t_ms, y)
+        for bar, value in zip(self.bars['aortic'], aortic_CO):
+            bar.set_height(value)
+        for bar, value in zip(self.bars['pulmonary'], pulmonary_CO):
+            bar.set_height(value)
+        self.title.set_text(f'CO - breath {breath + 1}')
+
+        # Only redraw the background when the time window moves on or the data leaves the axes
+        stale = False
+        if t_ms[-1] > self.axes['pressure'].get_xlim()[1]:
+            start = t_ms[-1] - 0.5 * self.window * 1e3
+            for panel in ('pressure', 'volume', 'thorax'):
+                self.axes[panel].set_xlim(start, start + self.window * 1e3)
+            stale = True
+        for panel in ('pressure', 'volume', 'thorax'):
+            columns = [i for i, s in enumerate(LIVE_SIGNALS) if s[0] == panel]
+            low, high = np.nanmin(data[:, columns]), np.nanmax(data[:, columns])
+            y_min, y_max = self.axes[panel].get_ylim()
+            if np.isfinite(low) and np.isfinite(high) and (low < y_min or high > y_max):
+                margin = 0.05 * (max(high, y_max) - min(low, y_min))
+                self.axes[panel].set_ylim(min(low, y_min) - margin, max(high, y_max) + margin)
+                stale = True
+        if stale:
+            self._redraw_background()
+        self._blit()
@@ -0,0 +1,136 @@
+import numpy as np
+from heartrate import HeartRateTimeline
+from cardiac_calculations import calculate_CO_per_beat
+
+
+def cross_correlation(x, y):
+    """
+    Normalized cross-correlation of every row of x with the same row of y, via the FFT
+    (zero padded, so not circular).
+
+    Parameters:
+    x, y (ndarray): Series (n) or batches of series (n_runs x n), evenly spaced.
+
+    Returns:
+    tuple: (lags (2n - 1), correlation (... x 2n - 1)). A peak at a positive lag means that
+           y follows x by that many samples.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = x.shape[-1]
+    x = x - x.mean(axis=-1, keepdims=True)
+    y = y - y.mean(axis=-1, keepdims=True)
+    n_fft = 1 << int(np.ceil(np.log2(2 * n - 1)))
+    spectrum = np.conj(np.fft.rfft(x, n_fft, axis=-1)) * np.fft.rfft(y, n_fft, axis=-1)
+    correlation = np.fft.irfft(spectrum, n_fft, axis=-1)
+    correlation = np.concatenate([correlation[..., n_fft - n + 1:], correlation[..., :n]], axis=-1)
+    norm = np.sqrt(np.sum(x ** 2, axis=-1) * np.sum(y ** 2, axis=-1))[..., None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.arange(-n + 1, n), correlation / norm
+
+
+def coherence(x, y, segment_length):
+    """
+    Magnitude-squared coherence and cross-spectrum phase of every row of x and y, averaged
+    over half-overlapping Hann-windowed segments (Welch).
+
+    Parameters:
+    x, y (ndarray): Series (n) or batches of series (n_runs x n), evenly spaced.
+    segment_length (int): Number of samples per segment, at most the length of the series
+                          (with one segment the coherence is 1).
+
+    Returns:
+    tuple: (frequencies [cycles per sample], coherence, phase [rad]); a positive phase means
+           that y follows x.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = x.shape[-1]
+    segment_length = min(segment_length, n)
+    step = max(segment_length // 2, 1)
+    starts = np.arange(0, n - segment_length + 1, step)
+    index = starts[:, None] + np.arange(segment_length)
+    window = np.hanning(segment_length)
+
+    def segments(z):
+        z = z[..., index]  # (..., n_segments, segment_length)
+        return np.fft.rfft((z - z.mean(axis=-1, keepdims=True)) * window, axis=-1)
+
+    X, Y = segments(x), segments(y)
+    Sxy = np.mean(np.conj(X) * Y, axis=-2)
+    Sxx = np.mean(np.abs(X) ** 2, axis=-2)
+    Syy = np.mean(np.abs(Y) ** 2, axis=-2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        coh = np.abs(Sxy) ** 2 / (Sxx * Syy)
+    return np.fft.rfftfreq(segment_length), coh, -np.angle(Sxy)
+
+
+def beat_output_series(traces, cycle_times, breath_cycle_time):
+    """
+    Per-beat aortic (LvSyArt) and pulmonary (RvPuArt) cardiac output of all stored beats.
+
+    Returns:
+    tuple: (aortic CO, pulmonary CO [L/min], mean beat length [s])
+    """
+    timeline = HeartRateTimeline.for_model(traces, cycle_times, breath_cycle_time)
+    aortic = calculate_CO_per_beat(traces['Valve']['q'][:, 'LvSyArt'], timeline)
+    pulmonary = calculate_CO_per_beat(traces['Valve']['q'][:, 'RvPuArt'], timeline)
+    return aortic, pulmonary, np.mean(timeline.cycle_times)
+
+
+def coupling_analysis(pulmonary, aortic, n_beats, beat_length, segment_breaths=4):
+    """
+    Left/right output coupling of one or many runs: the lag of the LV output (aortic) behind
+    the RV output (pulmonary) through the pulmonary circulation.
+
+    Parameters:
+    pulmonary, aortic (ndarray): Per-beat CO series (n) or batches (n_runs x n) of equal length.
+    n_beats (int): Number of heartbeats per breath (respiratory frequency is 1 / n_beats per beat).
+    beat_length (float or ndarray): Mean beat length [s] (per run) to convert beats to seconds.
+    segment_breaths (int): Number of breaths per coherence segment (fewer if the series are shorter).
+
+    Returns:
+    dict: 'lag_beats' and 'lag_seconds' (peak of the cross-correlation within half a breath),
+          'correlation' (its value), 'coherence' and 'phase_lag_seconds' at the respiratory frequency.
+    """
+    lags, correlation = cross_correlation(pulmonary, aortic)
+    window = np.abs(lags) <= n_beats // 2
+    peak = np.argmax(correlation[..., window], axis=-1)
+    lag_beats = lags[window][peak]
+
+    n_breaths = np.shape(pulmonary)[-1] // n_beats
+    if n_breaths < 1:
+        raise ValueError(f'Coupling analysis needs at least one breath ({n_beats} beats) per series')
+    frequencies, coh, phase = coherence(pulmonary, aortic, min(segment_breaths, n_breaths) * n_beats)
+    respiratory = np.argmin(np.abs(frequencies - 1 / n_beats))
+    phase_lag_beats = phase[..., respiratory] / (2 * np.pi * frequencies[respiratory])
+
+    return {
+        'lag_beats': lag_beats,
+        'lag_seconds': lag_beats * beat_length,
+        'correlation': np.take_along_axis(correlation[..., window], np.expand_dims(peak, -1), -1)[..., 0],
+        'coherence': coh[..., respiratory],
+        'phase_lag_seconds': phase_lag_beats * beat_length,
+    }
+
+
+def batch_coupling(runs, n_beats, segment_breaths=4):
+    """
+    Coupling analysis of many runs at once (one batched FFT over all runs). The series are
+    cut to the length of the shortest run.
+
+    Parameters:
+    runs (list): Stored TraceSets; the trigger schedule is read from their meta data
+                 (cycle_times, breath_cycle_time), so plain models are not accepted.
+    n_beats (int): Number of heartbeats per breath.
+    segment_breaths (int): Breaths per coherence segment, see coupling_analysis.
+
+    Returns:
+    dict: As coupling_analysis, one value per run.
+    """
+    series = [beat_output_series(traces, traces.cycle_times, traces.breath_cycle_time) for traces in runs]
+    n = min(len(aortic) for aortic, _, _ in series)
+    aortic = np.array([a[:n] for a, _, _ in series])
+    pulmonary = np.array([p[:n] for _, p, _ in series])
+    beat_length = np.array([length for _, _, length in series])
+    return coupling_analysis(pulmonary, aortic, n_beats, beat_length, segment_breaths)
@@ -1,15 +1,86 @@
+import os
+import re
+import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
+from matplotlib.collections import LineCollection
+from bootstrap_stats import bootstrap_ci
+from cardiac_calculations import calculate_stroke_work
+from heartrate import HeartRateTimeline
+from trace_pyramid import TracePyramid, signal_key
+from downsampling import downsample
+
+
+def use_headless_backend():
+    """
+    Switch matplotlib to the non-interactive Agg backend (render nodes without display).
+    Call before any figure is created.
+    """
+    matplotlib.use('Agg')
 
 
 class HemodynamicPlotter:
-    def __init__(self, model, cycle_times, n_beats, breath_cycle_time):
+    def __init__(self, model, cycle_times, n_beats, breath_cycle_time, pyramids=None,
+                 save_dir=None, formats=('png',), downsample='minmax', blit=False, pv_color='beat'):
+        """
+        Parameters:
+        model: Model (or stored TraceSet) that contains all the data.
+        cycle_times (list): List of cycle times for each beat.
+        n_beats (int): Number of heartbeats.
+        breath_cycle_time (float): Length of one breathing cycle [s].
+        pyramids (dict or bool, optional): Min/max pyramids of the signals (trace_pyramid.py) to make
+                                           the time plots zoomable, e.g. stored_pyramids(trace_path, traces);
+                                           True builds them when plotting.
+        save_dir (str, optional): Headless mode: write every figure to this directory and close it
+                                  instead of showing it.
+        formats (tuple): File formats used in headless mode ('png', 'svg', 'pdf', ...).
+        downsample (str): Downsampling of the time plots to the axis width: 'minmax' (exact peaks),
+                          'lttb' or None (draw every sample), see downsampling.py.
+        blit (bool): Interactive sessions: redraw an overview template that is reused for the next
+                     run with blitting (see OverviewTemplate); ignored in headless mode.
+        pv_color (str): Coloring of the PV loops of the overview: 'beat' or 'phase' (respiratory phase).
+        """
         self.model = model
         self.cycle_times = cycle_times
         self.n_beats = n_beats
         self.breath_cycle_time = breath_cycle_time
+        self.pyramids = {} if pyramids is True else (None if pyramids is False else pyramids)
+        self.save_dir = save_dir
+        self.formats = formats
+        self.downsample = downsample
+        self.blit = blit
+        self.pv_color = pv_color
+        self.template = None  # OverviewTemplate of the last plot_overview call
+
+    def _finish(self, fig, name, geometry=None, close=True):
+        """
+        Show the figure, or in headless mode save it as save_dir/name.<format> and close it.
+
+        Returns:
+        list: Paths of the saved files (empty when the figure is shown).
+        """
+        if self.save_dir is None:
+            window = getattr(plt.get_current_fig_manager(), 'window', None)
+            if geometry is not None and hasattr(window, 'setGeometry'):  # Qt backends only
+                window.setGeometry(*geometry)
+            plt.show()
+            return []
+
+        os.makedirs(self.save_dir, exist_ok=True)
+        paths = []
+        for fmt in self.formats:
+            path = os.path.join(self.save_dir, f'{name}.{fmt}')
+            fig.savefig(path)
+            paths.append(path)
+        if close:
+            plt.close(fig)
+        return paths
 
-    def plot_overview(self, aortic_CO_list, pulmonary_CO_list):
+    @staticmethod
+    def _file_name(title):
+        return re.sub(r'[^\w]+', '_', title).strip('_').lower()
+
+    def plot_overview(self, aortic_CO_list, pulmonary_CO_list, filename='overview', template=None, pv_color=None):
         """
         Function to plot all signals of interest: 
             volumes: RA, LA, RV, LV
@@ -26,310 +97,428 @@ class HemodynamicPlotter:
         cycle_times (list): List of cycle times for each beat.
         n_beats (int): Number of heartbeats.
         CO_list (list): List of cardiac output values for each beat.
+        filename (str): File name (without extension) in headless mode.
+        template (OverviewTemplate, optional): Existing overview figure to update instead of
+                                               building a new one (it is not closed in headless mode).
+                                               The template used is kept as self.template, so the
+                                               next run can be drawn with template=plotter.template.
+        pv_color (str, optional): Coloring of the PV loops of a new template ('beat' or 'phase'),
+                                  default self.pv_color.
     
         Returns:
         One figure with 13 subplots of the signals of interest .
         """
-        
-        # Define colors
-        color1 = '#00BFFF'  # Light blue
-        color2 = '#00008B'  # Dark blue
-        color3 = 'cyan'
-        color4 = '#8B0000'  # Dark red
-        color5 = 'red'  # Firebrick
-        color6 = 'orange'  # Indian red
-        
-        # Create a figure with a 4x2 grid layout to accommodate the new plot
-        # fig, ((ax1, ax2, ax9, ax10), (ax3, ax4, ax11, ax12), (ax5, ax6, ax13, ax14), (ax7, ax8, ax15, ax16)) = plt.subplots(4, 4, figsize=(10, 10))  # Adjust figsize as needed
-        
-        fig = plt.figure(figsize=(10, 10))
-        gs = fig.add_gridspec(4, 4)
-        
-        # Create subplots in the 4x4 grid
-        ax1 = fig.add_subplot(gs[0, 0])  # Top-left
-        ax2 = fig.add_subplot(gs[0, 1])  # Top
-        ax9 = fig.add_subplot(gs[0, 2])  # Top
-        ax10 = fig.add_subplot(gs[0, 3])  # Top-right
-        
-        ax3 = fig.add_subplot(gs[1, 0])  # 2nd row
-        ax4 = fig.add_subplot(gs[1, 1])
-        ax11 = fig.add_subplot(gs[1, 2])
-        ax12 = fig.add_subplot(gs[1, 3])
-        
-        ax5 = fig.add_subplot(gs[2, 0])  # 3rd row
-        ax6 = fig.add_subplot(gs[2, 1])
-        
-        ax7 = fig.add_subplot(gs[3, 0])  # 4th row
-        ax8 = fig.add_subplot(gs[3, 1])
-        
-        # Use the 2x2 space on the lower right (axes 13-16)
-        ax_larger = fig.add_subplot(gs[2:, 2:])  # Merge bottom-right 2x2
-        
-        # Right Heart Volume Plot: Right Atrium and Right Ventricle
-        ax1.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['V'][:, 'Ra'] * 1e6, 
-                 label="RA", color=color1)
-        
-        ax1.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['V'][:, 'cRv'] * 1e6, 
-                 label="RV", color=color2)
-        
-        ax1.set_ylim(0, 150)
-        ax1.set_yticks(np.arange(0, 151, 25))
-        ax1.set_xlabel('Time [ms]')
-        ax1.set_ylabel('Volume [ml]')
-        ax1.set_title('Right Heart', fontweight='bold')
-        ax1.legend(ncol=2, loc='upper right')
-        
-        # Left Heart Volume Plot: Left Atrium and Left Ventricle
-        ax2.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['V'][:, 'La'] * 1e6, 
-                 label="LA", color=color4)
-        
-        ax2.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['V'][:, 'cLv'] * 1e6, 
-                 label="LV", color=color5)
-        
-        ax2.set_ylim(0, 250)
-        ax2.set_yticks(np.arange(0,251, 50))
-        ax2.set_xlabel('Time [ms]')
-        ax2.set_ylabel('Volume [ml]')
-        ax2.set_title('Left Heart', fontweight='bold')
-        ax2.legend(ncol=2, loc='upper right')
-        
-        # Right Heart Pressure Plot: Right Atrium, Right Ventricle, Pulmonary Artery
-        ax3.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['p'][:, 'Ra'] / 133, 
-                 label="RA", color=color1)
-        
-        ax3.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['p'][:, 'cRv'] / 133, 
-                 label="RV", color=color2)
-        
-        ax3.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['p'][:, 'PuArt'] / 133, 
-                 label="PA", color=color3)
-        
-        ax3.set_ylim(0, 150)
-        ax3.set_yticks(np.arange(0, 151, 25))
-        ax3.set_xlabel('Time [ms]')
-        ax3.set_ylabel('Pressure [mmHg]')
-        ax3.legend(ncol=3, loc='upper right')
-        
-        # Left Heart Pressure Plot: Left Atrium, Left Ventricle, Aorta
-        ax4.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['p'][:, 'La'] / 133, 
-                 label="LA", color=color4)
-        
-        ax4.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['p'][:, 'cLv'] / 133, 
-                 label="LV", color=color5)
-        
-        ax4.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Cavity']['p'][:, 'SyArt'] / 133, 
-                 label="AO", color=color6)
-        
-        ax4.set_ylim(0, 150)
-        ax4.set_yticks(np.arange(0, 151, 25))
-        ax4.set_xlabel('Time [ms]')
-        ax4.set_ylabel('Pressure [mmHg]')
-        ax4.legend(ncol=3, loc='upper right')
-        
-        # Right Heart Transmural Pressure Plot: Right Atrium and Right Ventricle
-        p_ra = self.model['Cavity']['p'][:, 'Ra']*7.5e-3
-        p_rv = self.model['Cavity']['p'][:, 'cRv']*7.5e-3
-        p_thorax = self.model['Thorax']['p'][:, 0]*7.5e-3
-        
-        ax5.plot(self.model['Solver']['t'] * 1e3,
-                 p_ra-p_thorax,
-                 label="RA", color=color1)
-        
-        ax5.plot(self.model['Solver']['t'] * 1e3,
-                 p_rv-p_thorax,
-                 label="RV", color=color2)
-        
-        ax5.set_ylim(0, 150)
-        ax5.set_yticks(np.arange(0, 151, 25))
-        ax5.set_xlabel('Time [ms]')
-        ax5.set_ylabel('Transmural pressure [mmHg]')
-        ax5.legend(ncol=2, loc='upper right')
-        
-        
-        # Left Heart Transmural Pressure Plot: Left Atrium and Left Ventricle
-        p_la = self.model['Cavity']['p'][:, 'La']*7.5e-3 
-        p_lv = self.model['Cavity']['p'][:, 'cLv']*7.5e-3
-        
-        ax6.plot(self.model['Solver']['t'] * 1e3,
-                 p_la-p_thorax,
-                 label="LA", color=color4)
-        
-        ax6.plot(self.model['Solver']['t'] * 1e3,
-                 p_lv-p_thorax,
-                 label="LV", color=color5)
-        
-        ax6.set_ylim(0, 150)
-        ax6.set_yticks(np.arange(0, 151, 25))
-        ax6.set_xlabel('Time [ms]')
-        ax6.set_ylabel('Transmural pressure [mmHg]')
-        ax6.legend(ncol=2, loc='upper right')
-    
-        # Right Heart Stress Plot: Right Atrium, Right Ventricle
-        ax7.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Patch']['Sf'][:, 'pRa0']*1e-3, 
-                 label="RA", color=color1)
-        
-        ax7.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Patch']['Sf'][:, 'pRv0']*1e-3, 
-                 label="RV", color=color2)
-        
-        ax7.set_ylim(0, 100)
-        ax7.set_yticks(np.arange(0, 101, 25))
-        ax7.set_xlabel('Time [ms]')
-        ax7.set_ylabel('Total stress [kPa]')
-        ax7.legend(ncol=2, loc='upper right')
-    
-        # Left Heart Stress Plot: Left Atrium, Left Ventricle
-        ax8.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Patch']['Sf'][:, 'pLa0']*1e-3, 
-                 label="LA", color=color4)
-        
-        ax8.plot(self.model['Solver']['t'] * 1e3, 
-                 self.model['Patch']['Sf'][:, 'pLv0']*1e-3, 
-                 label="LV", color=color5)
-        
-        ax8.set_ylim(0, 100)
-        ax8.set_yticks(np.arange(0, 151, 25))
-        ax8.set_xlabel('Time [ms]')
-        ax8.set_ylabel('Total stress [kPa]')
-        ax8.legend(ncol=2, loc='upper right')
-    
-        # Thorax Pressure Plot
-        ax9.plot(self.model['Solver']['t'] * 1e3, p_thorax, color='blue')
-        ax9.grid(True)
-        ax9.set_xlabel('Time [ms]')
-        ax9.set_ylabel('Pressure [mmHg]')
-        ax9.set_title('Thorax Pressure', fontweight='bold')
-        
-        # Plot the BPM values against the calculated time points
-        amount = self.model['Solver']['store_beats']
-        bpm_values = [60 / cycle_time for cycle_time in self.cycle_times[1:]] 
-        bpm_values = np.append(bpm_values, bpm_values[-1]) # for plottin purposes
-        bpm_values_repeated = np.tile(bpm_values, amount) 
-        single_cycle_time_points = np.cumsum(self.cycle_times[0:]) * 1e3  # Convert to milliseconds
-        time_points = np.concatenate([single_cycle_time_points + (i * self.breath_cycle_time * 1e3) 
-                                      for i in range(amount)])  # Adjust time points for each beat repetition
-        
-        ax11.step(time_points, bpm_values_repeated, where='post', color='blue', linewidth=1.5)
-        ax11.grid(True)
-        ax11.set_xlabel('Time [ms]')
-        ax11.set_ylabel('Heart rate [bpm]')
-        ax11.set_title('Heart rate over time', fontweight='bold')
-        
-        # Cardiac output bar plot aorta
-        ax12.bar(range(1, self.n_beats+1), aortic_CO_list,  color=color5)
-        ax12.set_xlabel('Beat Number')
-        ax12.set_ylabel('Cardiac Output (L/min)')
-        ax12.set_title('CO - aorta', fontweight='bold') 
-        
-        # Cardiac output bar plot pulmonary artery
-        ax10.bar(range(1, self.n_beats+1), pulmonary_CO_list,  color=color2)
-        ax10.set_xlabel('Beat Number')
-        ax10.set_ylabel('Cardiac Output (L/min)')
-        ax10.set_title('CO - pulmonary', fontweight='bold') 
-        
-        # Left Ventricle Pressure-Volume Loop
-        V_lv = self.model['Cavity']['V'][:, 'cLv']*1e6
-        
-        ax_larger.plot(V_lv, p_lv, label='Left Ventricle', color = color5)
-        ax_larger.set_xlabel('Volume [ml]')
-        ax_larger.set_ylabel('Pressure [mmHg]')
-        ax_larger.set_title('LV Pressure-Volume Loop', fontweight='bold')
-        
-        # Adjust layout for better spacing
-        plt.tight_layout()
-        
-        
-        # fig.delaxes(ax14)
-        # fig.delaxes(ax15)
-        # fig.delaxes(ax16)
-        
-        manager = plt.get_current_fig_manager()
-        manager.window.setGeometry(500, 100, 900, 900)
-        
-        # Show the figure
-        plt.show()
-
-
-    def compare_CO(self, CO_no_breathing, CO_breathing, title, y_label):
+        reuse = template is not None
+        if not reuse:
+            # Animated artists are left out of savefig, so no blitting in headless mode
+            template = OverviewTemplate(blit=self.blit and self.save_dir is None, downsample=self.downsample,
+                                        pv_color=pv_color or self.pv_color)
+        self.template = template
+        template.update(self.model, self.cycle_times, self.n_beats, self.breath_cycle_time,
+                        aortic_CO_list, pulmonary_CO_list, pyramids=self.pyramids)
+
+        if reuse:
+            template.draw()
+            if self.save_dir is not None:
+                return self._finish(template.fig, filename, close=False)
+            return []
+
+        # Show the figure (or save it in headless mode)
+        return self._finish(template.fig, filename, geometry=(500, 100, 900, 900))
+
+
+    def plot_grouped_bars(self, metrics, title, y_label, conditions=None, colors=None, ylim=None,
+                          filename=None, errors='std'):
         """
-        Compares cardiac output between no breathing and breathing conditions.
+        Grouped bar chart of a metric per beat for any number of conditions, with one
+        bar call per condition. If the metrics have a breath (or run) dimension, the bars
+        show the mean over it with the standard deviation or a bootstrap CI as error bars.
+
+        Parameters:
+        metrics (dict or ndarray): {condition: values} or an array (conditions x beats) or
+                                   (conditions x beats x breaths).
+        title (str): Title of the figure.
+        y_label (str): Label of the y-axis.
+        conditions (list, optional): Condition labels when metrics is an array.
+        colors (list, optional): Bar color per condition (default: the colors of the comparison plots).
+        ylim (tuple, optional): Limits of the y-axis.
+        filename (str, optional): File name (without extension) in headless mode.
+        errors (str): 'std' or 'bootstrap' (95% bootstrap confidence interval of the mean).
         """
-        bar_width = 0.35
-        index = np.arange(self.n_beats)
+        if isinstance(metrics, dict):
+            conditions = list(metrics.keys())
+            metrics = [metrics[condition] for condition in conditions]
+        metrics = np.asarray(metrics, dtype=float)
+        if conditions is None:
+            conditions = [f'Condition {i + 1}' for i in range(len(metrics))]
+
+        if metrics.ndim == 1:  # one value per condition, repeated for every beat
+            metrics = np.repeat(metrics[:, None], self.n_beats, axis=1)
 
-        plt.figure(figsize=(10, 6))
+        yerr = None
+        if metrics.ndim == 3:
+            if errors == 'bootstrap':
+                mean, low, high = bootstrap_ci(np.moveaxis(metrics, 2, 0))
+                yerr = np.stack([mean - low, high - mean], axis=1)  # conditions x 2 x beats
+            else:
+                yerr = np.std(metrics, axis=2)
+            metrics = np.mean(metrics, axis=2)
+        n_conditions, n_beats = metrics.shape
 
-        # Plot side-by-side bars for comparison
-        plt.bar(index, CO_no_breathing, bar_width, label='No Breathing', color='#1a2c5c')
-        plt.bar(index + bar_width, CO_breathing, bar_width, label='Breathing', color='#c43c70')
+        if colors is None:
+            colors = list(COMPARISON_COLORS[:n_conditions])
+            if n_conditions > len(COMPARISON_COLORS):
+                colors += list(plt.cm.tab20(np.linspace(0, 1, n_conditions - len(COMPARISON_COLORS))))
+
+        # Groups of bars centered on the beat number
+        bar_width = min(0.35, 0.8 / n_conditions)
+        index = np.arange(n_beats)
+        offsets = (np.arange(n_conditions) - (n_conditions - 1) / 2) * bar_width
+
+        fig = plt.figure(figsize=(10, 6))
+        for i in range(n_conditions):
+            plt.bar(index + offsets[i], metrics[i], bar_width, label=conditions[i], color=colors[i],
+                    yerr=None if yerr is None else yerr[i], capsize=2 if yerr is not None else 0)
 
         plt.xlabel('Beat Number', fontsize=12)
         plt.ylabel(y_label, fontsize=12)
         plt.title(title, fontsize=14, fontweight='bold')
 
-        plt.xticks(index + bar_width / 2, range(1, self.n_beats + 1))
-        plt.ylim(0, 7)
+        plt.xticks(index, range(1, n_beats + 1))
+        if ylim is not None:
+            plt.ylim(*ylim)
         plt.grid(True, axis='y', linestyle='--', alpha=0.7)
-        plt.legend()
+        plt.legend(ncol=max(1, n_conditions // 10))
 
         plt.tight_layout()
-        plt.show()
-    
-    def compare_CO_3bars(self, healthy, HFpEF, HFrEF, title, y_label):
+        return self._finish(fig, filename or self._file_name(title))
+
+    def compare_CO(self, CO_no_breathing, CO_breathing, title, y_label, filename=None):
         """
         Compares cardiac output between no breathing and breathing conditions.
         """
-        bar_width = 0.27
-        index = np.arange(self.n_beats)  
-    
-        plt.figure(figsize=(10, 6))
-    
-        plt.bar(index - bar_width, healthy, bar_width, label='Healthy', color='#1a2c5c') 
-        plt.bar(index, HFpEF, bar_width, label='HFpEF', color='#c43c70')  
-        plt.bar(index + bar_width, HFrEF, bar_width, label='HFrEF', color='c') 
-    
-        plt.xlabel('Beat Number', fontsize=12)
-        plt.ylabel(y_label, fontsize=12)
-        plt.title(title, fontsize=14, fontweight='bold')
-    
-        plt.xticks(index, range(1, self.n_beats + 1))  
-        plt.ylim(0, 7)
-        plt.grid(True, axis='y', linestyle='--', alpha=0.7)
-        plt.legend()
-    
-        plt.tight_layout()
-        plt.show()
-        
-    def compare_pressure_3bars(self, healthy, HFpEF, HFrEF, title, y_label):
+        return self.plot_grouped_bars([CO_no_breathing, CO_breathing], title, y_label,
+                                      conditions=['No Breathing', 'Breathing'], ylim=(0, 7), filename=filename)
+
+    def compare_CO_3bars(self, healthy, HFpEF, HFrEF, title, y_label, filename=None):
         """
-        Compares cardiac output between no breathing and breathing conditions.
+        Compares cardiac output between healthy, HFpEF and HFrEF.
         """
-        bar_width = 0.27
-        index = np.arange(self.n_beats)  
-    
-        plt.figure(figsize=(10, 6))
-    
-        plt.bar(index - bar_width, healthy, bar_width, label='Healthy', color='#1a2c5c') 
-        plt.bar(index, HFpEF, bar_width, label='HFpEF', color='#c43c70')  
-        plt.bar(index + bar_width, HFrEF, bar_width, label='HFrEF', color='c') 
-    
-        plt.xlabel('Beat Number', fontsize=12)
-        plt.ylabel(y_label, fontsize=12)
-        plt.title(title, fontsize=14, fontweight='bold')
-    
-        plt.xticks(index, range(1, self.n_beats + 1))  
-        plt.grid(True, axis='y', linestyle='--', alpha=0.7)
-        plt.legend()
-    
-        plt.tight_layout()
-        plt.show()
+        return self.plot_grouped_bars([healthy, HFpEF, HFrEF], title, y_label,
+                                      conditions=['Healthy', 'HFpEF', 'HFrEF'], ylim=(0, 7), filename=filename)
+
+    def compare_pressure_3bars(self, healthy, HFpEF, HFrEF, title, y_label, filename=None):
+        """
+        Compares pressure between healthy, HFpEF and HFrEF.
+        """
+        return self.plot_grouped_bars([healthy, HFpEF, HFrEF], title, y_label,
+                                      conditions=['Healthy', 'HFpEF', 'HFrEF'], filename=filename)
+
+
+# Bar colors of the condition comparisons
+COMPARISON_COLORS = ['#1a2c5c', '#c43c70', 'c']
+
+# Colors of the overview figure
+COLORS = {
+    'RA': '#00BFFF',  # Light blue
+    'RV': '#00008B',  # Dark blue
+    'PA': 'cyan',
+    'LA': '#8B0000',  # Dark red
+    'LV': 'red',
+    'AO': 'orange',
+}
+
+# Panels of the overview with time on the x-axis
+TIME_PANELS = ['volume_right', 'volume_left', 'pressure_right', 'pressure_left', 'transmural_right',
+               'transmural_left', 'stress_right', 'stress_left', 'thorax', 'heart_rate']
+
+# Time signals of the overview: (panel, label, component, variable, name, scale)
+# The transmural panels show the pressure minus the thorax pressure.
+OVERVIEW_SIGNALS = [
+    ('volume_right', 'RA', 'Cavity', 'V', 'Ra', 1e6),
+    ('volume_right', 'RV', 'Cavity', 'V', 'cRv', 1e6),
+    ('volume_left', 'LA', 'Cavity', 'V', 'La', 1e6),
+    ('volume_left', 'LV', 'Cavity', 'V', 'cLv', 1e6),
+    ('pressure_right', 'RA', 'Cavity', 'p', 'Ra', 1 / 133),
+    ('pressure_right', 'RV', 'Cavity', 'p', 'cRv', 1 / 133),
+    ('pressure_right', 'PA', 'Cavity', 'p', 'PuArt', 1 / 133),
+    ('pressure_left', 'LA', 'Cavity', 'p', 'La', 1 / 133),
+    ('pressure_left', 'LV', 'Cavity', 'p', 'cLv', 1 / 133),
+    ('pressure_left', 'AO', 'Cavity', 'p', 'SyArt', 1 / 133),
+    ('transmural_right', 'RA', 'Cavity', 'p', 'Ra', 7.5e-3),
+    ('transmural_right', 'RV', 'Cavity', 'p', 'cRv', 7.5e-3),
+    ('transmural_left', 'LA', 'Cavity', 'p', 'La', 7.5e-3),
+    ('transmural_left', 'LV', 'Cavity', 'p', 'cLv', 7.5e-3),
+    ('stress_right', 'RA', 'Patch', 'Sf', 'pRa0', 1e-3),
+    ('stress_right', 'RV', 'Patch', 'Sf', 'pRv0', 1e-3),
+    ('stress_left', 'LA', 'Patch', 'Sf', 'pLa0', 1e-3),
+    ('stress_left', 'LV', 'Patch', 'Sf', 'pLv0', 1e-3),
+    ('thorax', None, 'Thorax', 'p', 0, 7.5e-3),
+]
+
+
+class OverviewTemplate:
+    def __init__(self, blit=False, downsample='minmax', pv_color='beat'):
+        """
+        The 13-panel overview figure of HemodynamicPlotter.plot_overview, built once.
+        update() only replaces the data of the existing lines and bars, so flipping
+        through many runs does not rebuild the layout.
+
+        Parameters:
+        blit (bool): Interactive sessions: draw() only redraws the data artists on top of
+                     a cached background while the axis limits do not change.
+        downsample (str): Downsampling of the time plots to the axis width ('minmax', 'lttb' or None).
+                          Zooming in redraws the visible part from the full data.
+        pv_color (str): Coloring of the per-beat PV loops: 'beat' (beat number in the breath)
+                        or 'phase' (respiratory phase at the start of the beat).
+        """
+        self.blit = blit
+        self.downsample = downsample
+        self.pv_color = pv_color
+        self.fig = plt.figure(figsize=(10, 10))
+        gs = self.fig.add_gridspec(4, 4)
+
+        # Create subplots in the 4x4 grid, the 2x2 space on the lower right is one panel
+        self.axes = {
+            'volume_right': self.fig.add_subplot(gs[0, 0]),
+            'volume_left': self.fig.add_subplot(gs[0, 1]),
+            'thorax': self.fig.add_subplot(gs[0, 2]),
+            'CO_pulmonary': self.fig.add_subplot(gs[0, 3]),
+            'pressure_right': self.fig.add_subplot(gs[1, 0]),
+            'pressure_left': self.fig.add_subplot(gs[1, 1]),
+            'heart_rate': self.fig.add_subplot(gs[1, 2]),
+            'CO_aortic': self.fig.add_subplot(gs[1, 3]),
+            'transmural_right': self.fig.add_subplot(gs[2, 0]),
+            'transmural_left': self.fig.add_subplot(gs[2, 1]),
+            'stress_right': self.fig.add_subplot(gs[3, 0]),
+            'stress_left': self.fig.add_subplot(gs[3, 1]),
+            'PV_loop': self.fig.add_subplot(gs[2:, 2:]),
+        }
+
+        self.lines = []
+        for panel, label, _, _, _, _ in OVERVIEW_SIGNALS:
+            color = COLORS[label] if label else 'blue'
+            self.lines.append(self.axes[panel].plot([], [], label=label, color=color)[0])
+        self.hr_line = self.axes['heart_rate'].step([], [], where='post', color='blue', linewidth=1.5)[0]
+
+        # All LV pressure-volume loops in one artist, one path per beat
+        self.pv_loops = LineCollection([], cmap='viridis' if pv_color == 'beat' else 'twilight',
+                                       linewidths=1.0, label='Left Ventricle')
+        self.axes['PV_loop'].add_collection(self.pv_loops)
+        self.pv_colorbar = self.fig.colorbar(self.pv_loops, ax=self.axes['PV_loop'], pad=0.01,
+                                             label='Beat in breath' if pv_color == 'beat' else 'Respiratory phase')
+        self.stroke_work_text = self.axes['PV_loop'].text(0.02, 0.98, '', transform=self.axes['PV_loop'].transAxes,
+                                                          va='top', fontsize=9)
+        self.bars = {'CO_aortic': None, 'CO_pulmonary': None}
+
+        self._scales = [scale for _, _, _, _, _, scale in OVERVIEW_SIGNALS]
+        self._pyramids = [None] * len(self.lines)
+        self._full = [None] * len(self.lines)
+        self._background = None
+        self._laid_out = False
+        self._style()
+        for panel in TIME_PANELS[:-1]:
+            self.axes[panel].callbacks.connect('xlim_changed', lambda ax: self._refine(ax))
+
+    def _style(self):
+        ax = self.axes
+        for panel, ylim, yticks, ylabel in [
+                ('volume_right', 150, np.arange(0, 151, 25), 'Volume [ml]'),
+                ('volume_left', 250, np.arange(0, 251, 50), 'Volume [ml]'),
+                ('pressure_right', 150, np.arange(0, 151, 25), 'Pressure [mmHg]'),
+                ('pressure_left', 150, np.arange(0, 151, 25), 'Pressure [mmHg]'),
+                ('transmural_right', 150, np.arange(0, 151, 25), 'Transmural pressure [mmHg]'),
+                ('transmural_left', 150, np.arange(0, 151, 25), 'Transmural pressure [mmHg]'),
+                ('stress_right', 100, np.arange(0, 101, 25), 'Total stress [kPa]'),
+                ('stress_left', 100, np.arange(0, 151, 25), 'Total stress [kPa]')]:
+            ax[panel].set_ylim(0, ylim)
+            ax[panel].set_yticks(yticks)
+            ax[panel].set_xlabel('Time [ms]')
+            ax[panel].set_ylabel(ylabel)
+            n_lines = len(ax[panel].get_lines())
+            ax[panel].legend(ncol=n_lines, loc='upper right')
+        ax['volume_right'].set_title('Right Heart', fontweight='bold')
+        ax['volume_left'].set_title('Left Heart', fontweight='bold')
+
+        ax['thorax'].grid(True)
+        ax['thorax'].set_xlabel('Time [ms]')
+        ax['thorax'].set_ylabel('Pressure [mmHg]')
+        ax['thorax'].set_title('Thorax Pressure', fontweight='bold')
+
+        ax['heart_rate'].grid(True)
+        ax['heart_rate'].set_xlabel('Time [ms]')
+        ax['heart_rate'].set_ylabel('Heart rate [bpm]')
+        ax['heart_rate'].set_title('Heart rate over time', fontweight='bold')
+
+        for panel, title in [('CO_aortic', 'CO - aorta'), ('CO_pulmonary', 'CO - pulmonary')]:
+            ax[panel].set_xlabel('Beat Number')
+            ax[panel].set_ylabel('Cardiac Output (L/min)')
+            ax[panel].set_title(title, fontweight='bold')
+
+        ax['PV_loop'].set_xlabel('Volume [ml]')
+        ax['PV_loop'].set_ylabel('Pressure [mmHg]')
+        ax['PV_loop'].set_title('LV Pressure-Volume Loop', fontweight='bold')
+
+    def _pixel_width(self, ax):
+        return max(int(ax.get_window_extent().width), 100)
+
+    def _refine(self, ax):
+        # Redraw the lines of this axes at the resolution of the new x-limits
+        t_min, t_max = np.asarray(ax.get_xlim()) * 1e-3
+        n_pixels = self._pixel_width(ax)
+        for line, pyramid, full, scale in zip(self.lines, self._pyramids, self._full, self._scales):
+            if line.axes is not ax:
+                continue
+            if pyramid is not None:
+                t, y = pyramid.view(t_min, t_max, n_pixels)
+                line.set_data(t * 1e3, y * scale)
+            elif full is not None:
+                t, y = full
+                i_start = max(np.searchsorted(t, t_min) - 1, 0)
+                i_stop = np.searchsorted(t, t_max) + 1
+                t, y = downsample(t[i_start:i_stop], y[i_start:i_stop], n_pixels, self.downsample)
+                line.set_data(t * 1e3, y)
+
+    def _set_bars(self, panel, values, color):
+        values = np.asarray(values, dtype=float)
+        bars = self.bars[panel]
+        if bars is None or len(bars) != len(values):
+            if bars is not None:
+                bars.remove()
+            bars = self.axes[panel].bar(range(1, len(values) + 1), values, color=color)
+            self.bars[panel] = bars
+        else:
+            for bar, value in zip(bars, values):
+                bar.set_height(value)
+
+    def update(self, model, cycle_times, n_beats, breath_cycle_time, aortic_CO_list, pulmonary_CO_list,
+               pyramids=None):
+        """
+        Replace the data of the overview with another run.
+
+        Parameters:
+        model: Model (or stored TraceSet) that contains all the data.
+        cycle_times (list): List of cycle times for each beat.
+        n_beats (int): Number of heartbeats.
+        breath_cycle_time (float): Length of one breathing cycle [s].
+        aortic_CO_list, pulmonary_CO_list (list): Cardiac output values for each beat.
+        pyramids (dict, optional): Min/max pyramids (trace_pyramid.py) for zoomable time plots;
+                                   missing pyramids are built and added to the dict.
+        """
+        t = np.asarray(model['Solver']['t'])
+        p_thorax = model['Thorax']['p'][:, 0]
+
+        for i, (panel, _, component, var, name, scale) in enumerate(OVERVIEW_SIGNALS):
+            line = self.lines[i]
+            y = model[component][var][:, name]
+            transmural = panel.startswith('transmural')
+            if transmural:
+                y = y - p_thorax
+
+            if pyramids is None:
+                self._pyramids[i] = None
+                y = y * scale
+                if self.downsample is None:
+                    self._full[i] = None
+                    line.set_data(t * 1e3, y)
+                else:
+                    # Draw about 2 points per pixel, the full data is kept for zooming in
+                    self._full[i] = (t, y)
+                    t_view, y_view = downsample(t, y, self._pixel_width(line.axes), self.downsample)
+                    line.set_data(t_view * 1e3, y_view)
+                continue
+
+            key = signal_key(component, var, name)
+            pyramid = None if transmural else pyramids.get(key)
+            if pyramid is None:
+                pyramid = TracePyramid.build(t, y)
+                if not transmural:
+                    pyramids[key] = pyramid
+            self._pyramids[i] = pyramid
+            self._full[i] = None
+            t_view, y_view = pyramid.view(n_pixels=self._pixel_width(line.axes))
+            line.set_data(t_view * 1e3, y_view * scale)
+
+        # Heart rate step plot of the stored beats, on the same time axis as the other panels
+        timeline = HeartRateTimeline.for_model(model, cycle_times, breath_cycle_time)
+        self.hr_line.set_data(*timeline.step_data())
+
+        # Cardiac output bar plots
+        self._set_bars('CO_aortic', aortic_CO_list[:n_beats], COLORS['LV'])
+        self._set_bars('CO_pulmonary', pulmonary_CO_list[:n_beats], COLORS['RV'])
+
+        # Left Ventricle Pressure-Volume Loops, split at the beat starts
+        V_lv = model['Cavity']['V'][:, 'cLv'] * 1e6
+        p_lv = model['Cavity']['p'][:, 'cLv'] * 7.5e-3
+        starts, beat_in_breath = timeline.beat_starts, timeline.beat_in_breath
+        ends = np.append(starts[1:], len(t) - 1)
+        loops = np.column_stack([V_lv, p_lv])
+        self.pv_loops.set_segments([loops[start:end + 1] for start, end in zip(starts, ends)])
+        if self.pv_color == 'beat':
+            self.pv_loops.set_array(beat_in_breath + 1)
+            self.pv_loops.set_clim(0.5, n_beats + 0.5)
+            self.pv_colorbar.set_ticks(np.arange(1, n_beats + 1))
+        else:
+            self.pv_loops.set_array(((t[starts] - t[0]) % breath_cycle_time) / breath_cycle_time)
+            self.pv_loops.set_clim(0, 1)
+
+        # Stroke work (loop area) per beat, 1 ml*mmHg = 133.322e-6 J
+        stroke_work = calculate_stroke_work(V_lv, p_lv, starts) * 133.322e-6
+        self.stroke_work_text.set_text(f'Stroke work {np.mean(stroke_work):.2f} \u00b1 '
+                                       f'{np.std(stroke_work):.2f} J ({len(starts)} beats)')
+
+        previous = self._limits() if self.blit and self._laid_out else None
+        for ax in self.axes.values():
+            ax.relim()
+            if ax is self.axes['PV_loop']:
+                ax.update_datalim(loops)  # relim() does not include collections
+            ax.autoscale_view()
+        # The time axes span the stored time, the same for runs of equal length
+        for panel in TIME_PANELS:
+            self.axes[panel].set_xlim(t[0] * 1e3, t[-1] * 1e3)
+        if previous is not None:
+            # Blitting: the other limits only grow, so the cached background stays valid for similar runs
+            for (panel, ax), (xlim, ylim) in zip(self.axes.items(), previous):
+                if panel not in TIME_PANELS:
+                    ax.set_xlim(min(xlim[0], ax.get_xlim()[0]), max(xlim[1], ax.get_xlim()[1]))
+                ax.set_ylim(min(ylim[0], ax.get_ylim()[0]), max(ylim[1], ax.get_ylim()[1]))
+
+        # Adjust layout for better spacing, once (with the tick labels of the first run)
+        if not self._laid_out:
+            self.fig.tight_layout()
+            self._laid_out = True
+
+        if self.blit:
+            for artist in self._artists():
+                artist.set_animated(True)
+
+    def _artists(self):
+        artists = self.lines + [self.hr_line, self.pv_loops, self.stroke_work_text]
+        for bars in self.bars.values():
+            if bars is not None:
+                artists.extend(bars)
+        return artists
+
+    def _limits(self):
+        return [(ax.get_xlim(), ax.get_ylim()) for ax in self.axes.values()]
+
+    def draw(self):
+        """
+        Draw the current data. With blitting, only the data artists are redrawn as long
+        as the axis limits are the same as for the cached background.
+        """
+        canvas = self.fig.canvas
+        if not self.blit or not canvas.supports_blit:
+            canvas.draw_idle()
+            return
+
+        if self._background is None or self._limits() != self._background_limits:
+            canvas.draw()  # animated artists are left out of the background
+            self._background = canvas.copy_from_bbox(self.fig.bbox)
+            self._background_limits = self._limits()
+        else:
+            canvas.restore_region(self._background)
+        for artist in self._artists():
+            self.fig.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
@@ -0,0 +1,202 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+from multiprocessing import Pool
+
+
+class BreathAnimation:
+    def __init__(self, traces, fps=25, speed=0.5, trail=None, figsize=(10, 5), dpi=100, breath_cycle_time=None):
+        """
+        Animation of the LV and RV pressure-volume loops together with the thorax pressure
+        over consecutive breaths, to show how breathing shifts the loops.
+
+        Parameters:
+        traces: Model or stored TraceSet that contains all the data.
+        fps (int): Frames per second of the movie.
+        speed (float): Simulated seconds per second of movie.
+        trail (float, optional): Length of the drawn loop trail [s] (default: one breath).
+        figsize (tuple): Figure size in inches.
+        dpi (int): Resolution of the exported frames.
+        breath_cycle_time (float, optional): Length of one breathing cycle [s]; taken from the
+                                             TraceSet if not given. A model needs it (or trail).
+        """
+        self.fps = fps
+        self.speed = speed
+        self.figsize = figsize
+        self.dpi = dpi
+
+        self.t = np.asarray(traces['Solver']['t'])
+        self.t = self.t - self.t[0]
+        self.V = traces['Cavity']['V'][:, ['cLv', 'cRv']] * 1e6
+        self.p = traces['Cavity']['p'][:, ['cLv', 'cRv']] * 7.5e-3
+        self.p_thorax = traces['Thorax']['p'][:, 0] * 7.5e-3
+
+        dt = self.t[1] - self.t[0]
+        if trail is None:
+            trail = breath_cycle_time or getattr(traces, 'breath_cycle_time', None)
+            if trail is None:
+                raise ValueError("Give breath_cycle_time (or trail) when animating a model")
+        self.trail_samples = int(round(trail / dt))
+
+        # Sample index shown in every frame
+        frame_times = np.arange(0, self.t[-1], speed / fps)
+        self.frame_index = np.searchsorted(self.t, frame_times)
+
+    def __getstate__(self):
+        # Only the data is sent to the export workers, they build their own figure
+        return {key: value for key, value in self.__dict__.items()
+                if key in ('fps', 'speed', 'figsize', 'dpi', 't', 'V', 'p', 'p_thorax',
+                           'trail_samples', 'frame_index')}
+
+    @property
+    def n_frames(self):
+        return len(self.frame_index)
+
+    def setup(self, fig=None):
+        """
+        Create the figure and the artists that are updated every frame.
+        """
+        import matplotlib.pyplot as plt
+        self.fig = fig or plt.figure(figsize=self.figsize, dpi=self.dpi)
+        gs = self.fig.add_gridspec(2, 2, height_ratios=[3, 1])
+        ax_lv = self.fig.add_subplot(gs[0, 0])
+        ax_rv = self.fig.add_subplot(gs[0, 1])
+        ax_thorax = self.fig.add_subplot(gs[1, :])
+
+        self.artists = []
+        self.loops, self.markers = [], []
+        for column, (ax, title, color) in enumerate([(ax_lv, 'LV Pressure-Volume Loop', 'red'),
+                                                     (ax_rv, 'RV Pressure-Volume Loop', '#00008B')]):
+            ax.plot(self.V[:, column], self.p[:, column], color='lightgrey', linewidth=0.5)  # all breaths
+            loop, = ax.plot([], [], color=color, linewidth=1.5, animated=True)
+            marker, = ax.plot([], [], 'o', color=color, animated=True)
+            self.loops.append(loop)
+            self.markers.append(marker)
+            ax.set_xlabel('Volume [ml]')
+            ax.set_ylabel('Pressure [mmHg]')
+            ax.set_title(title, fontweight='bold')
+
+        ax_thorax.plot(self.t * 1e3, self.p_thorax, color='blue')
+        ax_thorax.set_xlabel('Time [ms]')
+        ax_thorax.set_ylabel('Thorax [mmHg]')
+        self.cursor = ax_thorax.axvline(0, color='k', animated=True)
+        self.time_text = ax_thorax.text(0.01, 0.9, '', transform=ax_thorax.transAxes, animated=True)
+
+        self.artists = self.loops + self.markers + [self.cursor, self.time_text]
+        self.fig.tight_layout()
+        return self.fig
+
+    def update(self, frame):
+        """
+        Update the artists for one frame.
+
+        Returns:
+        list: The updated artists (for blitting).
+        """
+        i = self.frame_index[frame]
+        start = max(0, i - self.trail_samples)
+        for column in range(2):
+            self.loops[column].set_data(self.V[start:i + 1, column], self.p[start:i + 1, column])
+            self.markers[column].set_data([self.V[i, column]], [self.p[i, column]])
+        self.cursor.set_xdata([self.t[i] * 1e3])
+        self.time_text.set_text(f't = {self.t[i]:.2f} s')
+        return self.artists
+
+    def play(self):
+        """
+        Show the animation interactively (FuncAnimation with blitting).
+        """
+        import matplotlib.pyplot as plt
+        from matplotlib.animation import FuncAnimation
+        self.setup()
+        self._animation = FuncAnimation(self.fig, self.update, frames=self.n_frames,
+                                        interval=1000 / self.fps, blit=True)
+        plt.show()
+
+    def render_frames(self, frames):
+        """
+        Render frames headless with blitting: the static background is drawn once and
+        only the animated artists are drawn on top of it for every frame.
+
+        Yields:
+        ndarray: RGBA image (height x width x 4, uint8) of every frame.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        fig = Figure(figsize=self.figsize, dpi=self.dpi)
+        canvas = FigureCanvasAgg(fig)
+        self.setup(fig)
+        canvas.draw()
+        background = canvas.copy_from_bbox(fig.bbox)
+        for frame in frames:
+            canvas.restore_region(background)
+            for artist in self.update(frame):
+                fig.draw_artist(artist)
+            yield np.asarray(canvas.buffer_rgba()).copy()
+
+    def export(self, path, n_workers=None):
+        """
+        Write the animation to an MP4 (needs ffmpeg) or GIF file. The frames are rendered
+        in parallel chunks, which are concatenated at the end.
+
+        Parameters:
+        path (str): Output file, '.mp4' or '.gif'.
+        n_workers (int, optional): Number of worker processes (default: number of cores).
+
+        Returns:
+        str: path
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in ('.mp4', '.gif'):
+            raise ValueError("Choose an .mp4 or .gif file")
+        if extension == '.mp4' and shutil.which('ffmpeg') is None:
+            raise RuntimeError("ffmpeg is needed for MP4 export")
+
+        n_workers = n_workers or os.cpu_count()
+        chunks = [chunk for chunk in np.array_split(np.arange(self.n_frames), n_workers) if len(chunk)]
+        with tempfile.TemporaryDirectory() as tmp:
+            jobs = [(self, chunk, os.path.join(tmp, f'chunk{k:04d}{extension}')) for k, chunk in enumerate(chunks)]
+            with Pool(len(jobs)) as pool:
+                chunk_paths = pool.map(_render_chunk, jobs)
+
+            if extension == '.mp4':
+                list_path = os.path.join(tmp, 'chunks.txt')
+                with open(list_path, 'w') as file:
+                    file.writelines(f"file '{chunk_path}'\n" for chunk_path in chunk_paths)
+                subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                '-i', list_path, '-c', 'copy', path], check=True)
+            else:
+                from PIL import Image, ImageSequence
+                frames = []
+                for chunk_path in chunk_paths:
+                    with Image.open(chunk_path) as image:
+                        frames.extend(frame.copy() for frame in ImageSequence.Iterator(image))
+                frames[0].save(path, save_all=True, append_images=frames[1:],
+                               duration=int(1000 / self.fps), loop=0)
+        return path
+
+
+def _render_chunk(job):
+    animation, frames, chunk_path = job
+    if chunk_path.endswith('.mp4'):
+        process = None
+        for image in animation.render_frames(frames):
+            if process is None:
+                height, width = image.shape[:2]
+                process = subprocess.Popen(
+                    ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+                     '-s', f'{width}x{height}', '-r', str(animation.fps), '-i', '-',
+                     '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', chunk_path],
+                    stdin=subprocess.PIPE)
+            process.stdin.write(image.tobytes())
+        process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed for {chunk_path}")
+    else:
+        from PIL import Image
+        frames = [Image.fromarray(image).convert('RGB').quantize() for image in animation.render_frames(frames)]
+        frames[0].save(chunk_path, save_all=True, append_images=frames[1:],
+                       duration=int(1000 / animation.fps), loop=0)
+    return chunk_path
@@ -0,0 +1,142 @@
+import os
+import glob
+import numpy as np
+from multiprocessing import Pool
+from cardiac_calculations import calculate_CO_per_beat
+from heartrate import HeartRateTimeline
+from hemodynamic_indices import compute_indices, chamber_index
+from trace_store import TraceSet
+
+# Bump this number whenever a metric definition in compute_metrics changes.
+# Stored results with another version are recomputed by ReanalysisPipeline.
+METRIC_VERSION = 4
+
+
+def compute_metrics(traces):
+    """
+    Metric engine: calculate the per-beat metrics of one run from its stored traces.
+
+    Parameters:
+    traces (TraceSet): Stored traces of the run.
+
+    Returns:
+    dict: Arrays with one value per beat of the first stored breath.
+    """
+    V_lv = traces['Cavity']['V'][:, 'cLv'] * 1e6
+    flow_aortic_valve = traces['Valve']['q'][:, 'LvSyArt']
+    flow_pulmonary_valve = traces['Valve']['q'][:, 'RvPuArt']
+    LA_stress = traces['Patch']['Sf'][:, 'pLa0'] * 1e-3
+
+    # All metrics use the beat boundaries of the heart rate timeline
+    timeline = HeartRateTimeline.for_model(traces, traces.cycle_times, traces.breath_cycle_time)
+    beat_lengths = timeline.beat_ends - timeline.beat_starts
+
+    # Stroke volume as max - min volume per beat (thorax_metRSA_v8okt.py), from the index library
+    indices = compute_indices(traces, traces.cycle_times, traces.breath_cycle_time)
+    first_breath = slice(0, traces.n_beats)
+
+    # EF as the ejected volume (integral of the aortic flow, ml) over the maximal LV volume
+    aortic_CO = calculate_CO_per_beat(flow_aortic_valve, timeline)
+    ejected_volume = aortic_CO / timeline.hr_per_beat * 1e3
+    EF = ejected_volume / np.maximum.reduceat(V_lv, timeline.beat_starts)
+
+    return {
+        'aortic_CO': aortic_CO[first_breath],
+        'pulmonary_CO': calculate_CO_per_beat(flow_pulmonary_valve, timeline)[first_breath],
+        'EF': EF[first_breath],
+        'SV_lv': chamber_index(indices, 'SV', 'cLv')[first_breath],
+        'SV_rv': chamber_index(indices, 'SV', 'cRv')[first_breath],
+        'EDV_lv': chamber_index(indices, 'EDV', 'cLv')[first_breath],
+        'ESV_lv': chamber_index(indices, 'ESV', 'cLv')[first_breath],
+        'dpdt_max_lv': chamber_index(indices, 'dpdt_max', 'cLv')[first_breath],
+        'tau_lv': chamber_index(indices, 'tau', 'cLv')[first_breath],
+        'stroke_work_lv': chamber_index(indices, 'stroke_work', 'cLv')[first_breath],
+        'LA_stress': (np.add.reduceat(LA_stress, timeline.beat_starts) / beat_lengths)[first_breath],
+    }
+
+
+def _reanalyse_one(job):
+    trace_path, result_path, source_stamp = job
+    metrics = compute_metrics(TraceSet.load(trace_path))
+    np.savez(result_path, metric_version=METRIC_VERSION, source_stamp=source_stamp, **metrics)
+    return trace_path
+
+
+class ReanalysisPipeline:
+    def __init__(self, trace_dir, results_dir=None, n_workers=None):
+        """
+        Re-apply the current metric engine (compute_metrics) to stored traces
+        instead of re-running the simulations.
+
+        Every run '<name>.npz' in trace_dir gets a result file '<name>.metrics.npz'
+        in results_dir, which records the METRIC_VERSION and the state of the trace
+        file it was computed from. Only stale results are recomputed.
+
+        Parameters:
+        trace_dir (str): Directory with the stored traces (TraceSet.save).
+        results_dir (str, optional): Directory for the metric results (default: trace_dir/metrics).
+        n_workers (int, optional): Number of worker processes (default: number of cores).
+        """
+        self.trace_dir = trace_dir
+        self.results_dir = results_dir or os.path.join(trace_dir, 'metrics')
+        self.n_workers = n_workers or os.cpu_count()
+
+    def trace_paths(self):
+        paths = glob.glob(os.path.join(self.trace_dir, '*.npz'))
+        return sorted(path for path in paths if not path.endswith(('.metrics.npz', '.pyramid.npz')))
+
+    def result_path(self, trace_path):
+        name = os.path.splitext(os.path.basename(trace_path))[0]
+        return os.path.join(self.results_dir, name + '.metrics.npz')
+
+    @staticmethod
+    def _source_stamp(trace_path):
+        stat = os.stat(trace_path)
+        return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+    def is_stale(self, trace_path):
+        """
+        A result is stale when it is missing, was made by another metric version
+        or when the trace file has changed since.
+        """
+        result_path = self.result_path(trace_path)
+        if not os.path.exists(result_path):
+            return True
+        with np.load(result_path) as result:
+            return (int(result['metric_version']) != METRIC_VERSION
+                    or str(result['source_stamp']) != self._source_stamp(trace_path))
+
+    def stale_runs(self):
+        return [path for path in self.trace_paths() if self.is_stale(path)]
+
+    def run(self):
+        """
+        Recompute all stale results in parallel.
+
+        Returns:
+        list: Trace paths that were (re)analysed.
+        """
+        os.makedirs(self.results_dir, exist_ok=True)
+        jobs = [(path, self.result_path(path), self._source_stamp(path)) for path in self.stale_runs()]
+        if not jobs:
+            return []
+        if self.n_workers == 1 or len(jobs) == 1:
+            return [_reanalyse_one(job) for job in jobs]
+        with Pool(min(self.n_workers, len(jobs))) as pool:
+            return list(pool.imap_unordered(_reanalyse_one, jobs))
+
+    def load_results(self):
+        """
+        Returns:
+        dict: Run name -> dict of per-beat metric arrays (current metric version only).
+        """
+        results = {}
+        for trace_path in self.trace_paths():
+            result_path = self.result_path(trace_path)
+            if self.is_stale(trace_path):
+                continue
+            name = os.path.splitext(os.path.basename(trace_path))[0]
+            with np.load(result_path) as result:
+                results[name] = {key: result[key] for key in result.files
+                                 if key not in ('metric_version', 'source_stamp')}
+        return results
@@ -0,0 +1,122 @@
+import numpy as np
+from heartrate import HeartRateTimeline
+
+
+def analytic_phase(signal):
+    """
+    Instantaneous phase of a signal from its analytic signal (Hilbert transform via the FFT).
+
+    Parameters:
+    signal (ndarray): Signal values (the mean is removed first).
+
+    Returns:
+    ndarray: Phase in cycles, between 0 and 1 (0 at the maxima of the signal).
+    """
+    x = np.asarray(signal, dtype=float)
+    x = x - np.mean(x)
+    n = len(x)
+    spectrum = np.fft.fft(x)
+    # Keep the positive frequencies (doubled), drop the negative ones
+    h = np.zeros(n)
+    h[0] = 1
+    if n % 2 == 0:
+        h[n // 2] = 1
+        h[1:n // 2] = 2
+    else:
+        h[1:(n + 1) // 2] = 2
+    analytic = np.fft.ifft(spectrum * h)
+    return (np.angle(analytic) / (2 * np.pi)) % 1
+
+
+def respiratory_phase(traces, breath_cycle_time=None, method='hilbert'):
+    """
+    Respiratory phase of every stored sample.
+
+    Parameters:
+    traces: Model or stored TraceSet that contains all the data.
+    breath_cycle_time (float, optional): Length of one breathing cycle [s], needed for 'schedule'.
+    method (str): 'hilbert' (analytic-signal phase of Thorax.p) or 'schedule' (the known thorax
+                  waveform: phase 0 at the start of every breath, as set with model['Thorax']['tr']).
+
+    Returns:
+    ndarray: Phase in cycles, between 0 and 1.
+    """
+    t = np.asarray(traces['Solver']['t'])
+    if method == 'hilbert':
+        return analytic_phase(traces['Thorax']['p'][:, 0])
+    if method == 'schedule':
+        if breath_cycle_time is None:
+            raise ValueError("breath_cycle_time is required for the 'schedule' phase")
+        return ((t - t[0]) % breath_cycle_time) / breath_cycle_time
+    raise ValueError(f"Unknown phase method '{method}'")
+
+
+def beat_phase(traces, cycle_times, breath_cycle_time, method='hilbert', at='start'):
+    """
+    Respiratory phase of every stored beat.
+
+    Parameters:
+    traces: Model or stored TraceSet that contains all the data.
+    cycle_times (list): List of cycle times for each beat.
+    breath_cycle_time (float): Length of one breathing cycle [s].
+    method (str): See respiratory_phase.
+    at (str): 'start' (phase at the beat start) or 'mid' (phase halfway the beat).
+
+    Returns:
+    ndarray: Phase per beat, between 0 and 1.
+    """
+    timeline = HeartRateTimeline.for_model(traces, cycle_times, breath_cycle_time)
+    phase = respiratory_phase(traces, breath_cycle_time, method)
+    if at == 'start':
+        return phase[timeline.beat_starts]
+    if at == 'mid':
+        return phase[(timeline.beat_starts + timeline.beat_ends - 1) // 2]
+    raise ValueError(f"Unknown beat position '{at}'")
+
+
+def phase_bin(phase, values, n_bins=12, groups=None):
+    """
+    Average per-beat values in respiratory phase bins, for all beats (and runs) at once.
+
+    Usage:
+        phases = np.concatenate([beat_phase(traces, ...) for traces in runs])
+        values = np.concatenate([metrics_per_beat for ...])
+        curves = phase_bin(phases, values, n_bins=8, groups=run_index_per_beat)
+
+    Parameters:
+    phase (ndarray): Phase per beat, between 0 and 1.
+    values (ndarray): One value per beat (n) or several metrics per beat (n x n_metrics).
+    n_bins (int): Number of equally wide phase bins.
+    groups (ndarray, optional): Group (e.g. run) number per beat, 0 .. n_groups - 1; gives one curve per group.
+
+    Returns:
+    dict: 'centers' (n_bins) and 'mean', 'std', 'count' with shape ([n_groups,] n_bins[, n_metrics]).
+          Empty bins have a NaN mean and std.
+    """
+    values = np.asarray(values, dtype=float)
+    one_metric = values.ndim == 1
+    values = values.reshape(len(values), -1)
+    n_metrics = values.shape[1]
+    n_groups = 1 if groups is None else int(np.max(groups)) + 1
+
+    bins = np.minimum((np.asarray(phase) * n_bins).astype(int), n_bins - 1)
+    cell = bins if groups is None else np.asarray(groups) * n_bins + bins
+
+    # One bincount over (cell, metric) pairs
+    key = (cell[:, None] * n_metrics + np.arange(n_metrics)).ravel()
+    size = n_groups * n_bins * n_metrics
+    count = np.bincount(key, minlength=size)
+    total = np.bincount(key, weights=values.ravel(), minlength=size)
+    squares = np.bincount(key, weights=values.ravel() ** 2, minlength=size)
+
+    shape = (n_groups, n_bins, n_metrics)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (total / count).reshape(shape)
+        std = np.sqrt(np.maximum(squares / count - (total / count) ** 2, 0)).reshape(shape)
+    count = count.reshape(shape)
+
+    if one_metric:
+        mean, std, count = mean[..., 0], std[..., 0], count[..., 0]
+    if groups is None:
+        mean, std, count = mean[0], std[0], count[0]
+    return {'centers': (np.arange(n_bins) + 0.5) / n_bins, 'mean': mean, 'std': std, 'count': count}
@@ -0,0 +1,123 @@
+import io
+import itertools
+import numpy as np
+
+
+def read_rr_intervals(path, column=None, delimiter=',', unit='auto', chunk_size=65536):
+    """
+    Stream RR intervals from a text or CSV file, chunk_size lines at a time,
+    so recordings of any length are read in bounded memory.
+
+    Parameters:
+    path (str): File with one RR interval per line, or a CSV file (with or without header).
+    column (str or int, optional): Column name or index with the RR intervals (default: first column).
+    delimiter (str): Column delimiter of CSV files.
+    unit (str): 's', 'ms' or 'auto' (ms if the first chunk has a median above 10).
+    chunk_size (int): Number of lines parsed at once.
+
+    Yields:
+    ndarray: RR intervals [s] of the next chunk.
+    """
+    with open(path) as file:
+        first_line = file.readline()
+        while first_line and not first_line.strip():
+            first_line = file.readline()
+        fields = [field.strip() for field in first_line.split(delimiter)]
+
+        # A header is any first line that is not numeric
+        try:
+            [float(field) for field in fields if field]
+            has_header = False
+        except ValueError:
+            has_header = True
+
+        if column is None:
+            column_index = 0
+        elif isinstance(column, str):
+            if not has_header or column not in fields:
+                raise ValueError(f"Column '{column}' not found in header of {path}")
+            column_index = fields.index(column)
+        else:
+            column_index = column
+
+        lines = file if has_header else itertools.chain([first_line], file)
+        scale = None
+        while True:
+            chunk = list(itertools.islice(lines, chunk_size))
+            if not chunk:
+                break
+            rr = np.loadtxt(io.StringIO(''.join(chunk)), delimiter=delimiter if len(fields) > 1 else None,
+                            usecols=column_index if len(fields) > 1 else None, ndmin=1)
+            rr = rr[np.isfinite(rr)]
+            if rr.size == 0:
+                continue
+            if scale is None:
+                if unit == 'auto':
+                    unit = 'ms' if np.median(rr) > 10 else 's'
+                scale = 1e-3 if unit == 'ms' else 1.0
+            yield rr * scale
+
+
+def breath_windows(rr_chunks, beats_per_breath, max_breaths=None):
+    """
+    Split a stream of RR intervals into breaths of beats_per_breath beats.
+
+    Parameters:
+    rr_chunks (iterable): RR interval arrays [s], e.g. from read_rr_intervals.
+    beats_per_breath (int): Beats per breath (= number of NetworkTrigger components).
+    max_breaths (int, optional): Stop after this many breaths.
+
+    Yields:
+    ndarray: Array (n_breaths, beats_per_breath + 1) of cycle_times per breath,
+             first column 0 as in the hand-written cycle_times lists.
+    """
+    remainder = np.empty(0)
+    n_breaths = 0
+    for rr in rr_chunks:
+        rr = np.concatenate([remainder, rr])
+        n = len(rr) // beats_per_breath
+        if max_breaths is not None:
+            n = min(n, max_breaths - n_breaths)
+        remainder = rr[n * beats_per_breath:]
+        if n > 0:
+            windows = rr[:n * beats_per_breath].reshape(n, beats_per_breath)
+            n_breaths += n
+            yield np.column_stack([np.zeros(n), windows])
+        if max_breaths is not None and n_breaths >= max_breaths:
+            return
+
+
+def trigger_times(cycle_times):
+    """
+    NetworkTrigger times for cycle_times of one or more breaths:
+    np.cumsum(cycle_times[0:-1]) per breath, as in the simulation scripts.
+
+    Parameters:
+    cycle_times (ndarray): Array (..., beats_per_breath + 1) with first column 0.
+
+    Returns:
+    tuple: (trigger_times (..., beats_per_breath), breath_cycle_times (...,))
+    """
+    cycle_times = np.asarray(cycle_times)
+    cumulative = np.cumsum(cycle_times, axis=-1)
+    return cumulative[..., :-1], cumulative[..., -1]
+
+
+def rr_schedule(path, beats_per_breath, **kwargs):
+    """
+    Stream NetworkTrigger schedules of a recording, breath by breath.
+
+    Usage:
+        for cycle_times, times, breath_cycle_time in rr_schedule('patient.csv', 5):
+            model['NetworkTrigger']['time'] = times
+            model['General']['t_cycle'] = breath_cycle_time
+            model.run(1)
+
+    Yields:
+    tuple: (cycle_times, trigger_times, breath_cycle_time) of every breath.
+    """
+    max_breaths = kwargs.pop('max_breaths', None)
+    for windows in breath_windows(read_rr_intervals(path, **kwargs), beats_per_breath, max_breaths):
+        times, breath_cycle_times = trigger_times(windows)
+        for i in range(len(windows)):
+            yield windows[i], times[i], breath_cycle_times[i]
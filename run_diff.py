@@ -0,0 +1,96 @@
+import numpy as np
+from beat_ensemble import resample_beats
+from cardiac_calculations import calculate_CO_per_beat
+from hemodynamic_indices import compute_indices
+from heartrate import HeartRateTimeline
+from trace_store import SIGNALS
+from trace_pyramid import signal_key
+
+
+def _cached(traces, key, compute):
+    # Derived results are kept in traces.cache (TraceSet), models are always recomputed
+    cache = getattr(traces, 'cache', None)
+    if cache is not None and key in cache:
+        return cache[key]
+    result = compute()
+    if cache is not None:
+        cache[key] = result
+    return result
+
+
+def _beat_waveforms(traces, timeline, n_phase):
+    data = np.column_stack([traces[component][var][:, names] for (component, var), names in SIGNALS.items()])
+    return resample_beats(timeline.time_points, data, timeline.beat_starts, timeline.beat_ends, n_phase)
+
+
+def _beat_metrics(traces, timeline):
+    metrics = dict(compute_indices(traces, traces.cycle_times, traces.breath_cycle_time))
+    metrics['aortic_CO'] = calculate_CO_per_beat(traces['Valve']['q'][:, 'LvSyArt'], timeline)
+    metrics['pulmonary_CO'] = calculate_CO_per_beat(traces['Valve']['q'][:, 'RvPuArt'], timeline)
+    return metrics
+
+
+class RunDiff:
+    def __init__(self, reference, other, n_phase=100):
+        """
+        Differences between two runs (e.g. without and with breathing), aligned on their
+        trigger schedules: beat k of one run is compared with beat k of the other, and
+        within a beat at the same normalized phase. Waveforms and metrics already in
+        traces.cache are reused.
+
+        Parameters:
+        reference, other (TraceSet): Stored traces of both runs; differences are other - reference.
+        n_phase (int): Number of phase points per beat.
+        """
+        self.keys = [signal_key(component, var, name) for (component, var), names in SIGNALS.items() for name in names]
+        self.phase = np.arange(n_phase) / n_phase
+
+        runs = []
+        for traces in (reference, other):
+            timeline = HeartRateTimeline.for_model(traces, traces.cycle_times, traces.breath_cycle_time)
+            waveforms = _cached(traces, ('beat_waveforms', n_phase), lambda: _beat_waveforms(traces, timeline, n_phase))
+            metrics = _cached(traces, 'beat_metrics', lambda: _beat_metrics(traces, timeline))
+            runs.append((timeline, waveforms, metrics))
+        (timeline_a, waveforms_a, metrics_a), (timeline_b, waveforms_b, metrics_b) = runs
+
+        self.n_beats = min(timeline_a.n_beats, timeline_b.n_beats)
+        self.beat_in_breath = timeline_a.beat_in_breath[:self.n_beats]
+        self.reference = waveforms_a[:self.n_beats]
+        self.delta = waveforms_b[:self.n_beats] - self.reference  # beats x signals x phase
+        self.metric_delta = {name: metrics_b[name][:self.n_beats] - metrics_a[name][:self.n_beats]
+                             for name in metrics_a}
+
+    def signal(self, component, var, name):
+        """
+        Returns:
+        ndarray: Difference of one signal (beats x phase).
+        """
+        return self.delta[:, self.keys.index(signal_key(component, var, name))]
+
+    def largest_effects(self, n=10):
+        """
+        Where the runs differ most, relative to the range of every signal (the larger of both runs).
+
+        Returns:
+        list: n dicts with 'signal', 'beat', 'phase', 'delta' and 'relative' (delta / range),
+              largest first; one entry per signal.
+        """
+        signal_range = np.maximum(np.ptp(self.reference, axis=(0, 2)),
+                                  np.ptp(self.reference + self.delta, axis=(0, 2)))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            relative = np.where(signal_range[:, None] > 0, np.abs(self.delta) / signal_range[:, None], 0)
+        flat = relative.transpose(1, 0, 2).reshape(len(self.keys), -1)
+        best = np.argmax(flat, axis=1)  # strongest point per signal
+        beat, phase = np.unravel_index(best, relative.shape[::2])
+        signals = np.argsort(-flat[np.arange(len(self.keys)), best])[:n]
+        return [{'signal': self.keys[s], 'beat': int(beat[s]), 'phase': float(self.phase[phase[s]]),
+                 'delta': float(self.delta[beat[s], s, phase[s]]), 'relative': float(relative[beat[s], s, phase[s]])}
+                for s in signals]
+
+    def metric_summary(self):
+        """
+        Returns:
+        dict: Metric name -> mean and maximal absolute per-beat delta (per chamber or patch where applicable).
+        """
+        return {name: {'mean': np.mean(delta, axis=0), 'max_abs': np.max(np.abs(delta), axis=0)}
+                for name, delta in self.metric_delta.items()}
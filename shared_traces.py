@@ -0,0 +1,128 @@
+import sys
+import numpy as np
+from multiprocessing import shared_memory
+from trace_store import TraceSet
+
+
+def block_name(prefix, index):
+    return f'{prefix}_{index}'
+
+
+def unlink_blocks(prefix):
+    """
+    Free the blocks published with this prefix (numbered from 0, stops at the first missing block).
+    """
+    index = 0
+    while True:
+        try:
+            shm = shared_memory.SharedMemory(name=block_name(prefix, index))
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+        index += 1
+
+
+def publish_traces(traces, prefix=None):
+    """
+    Copy the arrays of a TraceSet into shared memory blocks (one per signal).
+
+    The blocks stay alive after this process closes its handles, only the
+    returned descriptor (block names, shapes, dtypes and meta data) has to be
+    passed to the parent process. Ownership moves to whoever attaches with
+    SharedTraces, which must call release() (or use it as a context manager).
+
+    Parameters:
+    traces (TraceSet): Traces of one run.
+    prefix (str, optional): Name the blocks '<prefix>_0', '<prefix>_1', ..., so that the
+                            parent can free them with unlink_blocks even if the descriptor
+                            never arrives (default: random names).
+
+    Returns:
+    dict: Small, picklable descriptor of the shared traces.
+    """
+    blocks = {}
+    created = []
+    try:
+        for index, (key, array) in enumerate(traces.arrays.items()):
+            array = np.ascontiguousarray(array)
+            name = None if prefix is None else block_name(prefix, index)
+            shm = shared_memory.SharedMemory(name=name, create=True, size=max(array.nbytes, 1))
+            created.append(shm)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+            blocks[key] = (shm.name, array.shape, array.dtype.str)
+    except Exception:
+        for shm in created:
+            shm.close()
+            shm.unlink()
+        raise
+
+    for shm in created:
+        shm.close()
+    return {'blocks': blocks, 'meta': traces.meta}
+
+
+class SharedTraces:
+    def __init__(self, descriptor):
+        """
+        Attach to traces published with publish_traces. The arrays of .traces
+        are NumPy views on the shared memory, nothing is copied.
+
+        The blocks are freed with release(), which refuses (BufferError) while views
+        taken from .traces are still alive. Use copy() to keep (part of) the data.
+
+        Parameters:
+        descriptor (dict): Descriptor returned by publish_traces.
+        """
+        self.descriptor = descriptor
+        self._blocks = []
+        arrays = {}
+        for key, (name, shape, dtype) in descriptor['blocks'].items():
+            shm = shared_memory.SharedMemory(name=name)
+            self._blocks.append(shm)
+            arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        self.traces = TraceSet(arrays, descriptor['meta'])
+
+    def copy(self):
+        """
+        Returns:
+        TraceSet: Private copy of the traces, independent of the shared blocks.
+        """
+        return TraceSet({key: np.array(a) for key, a in self.traces.arrays.items()}, dict(self.traces.meta))
+
+    def close(self):
+        """
+        Detach from the blocks in this process, without freeing them (e.g. when
+        the descriptor is handed on to another consumer).
+        """
+        if self.traces is not None:
+            # The arrays of .traces are the only owners of the shared buffers: any other
+            # reference (a view, or a derived result in the cache) would outlive the blocks
+            self.traces.cache.clear()
+            if any(sys.getrefcount(array) > 3 for array in self.traces.arrays.values()):
+                raise BufferError("Views of the shared traces are still in use; copy() the data "
+                                  "that must be kept and delete the views first")
+        self.traces = None
+        for shm in self._blocks:
+            shm.close()
+        self._blocks = []
+
+    def release(self):
+        """
+        Detach and free the shared memory blocks. Nothing is freed while views are still in use.
+        """
+        names = [name for name, _, _ in self.descriptor['blocks'].values()]
+        self.close()
+        for name in names:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+            except FileNotFoundError:
+                continue
+            shm.close()
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,55 @@
+import os
+import uuid
+from multiprocessing import Pool, resource_tracker
+from shared_traces import publish_traces, unlink_blocks, SharedTraces
+
+
+def _run_scenario(job):
+    simulate, index, scenario, prefix = job
+    traces = simulate(scenario)
+    if prefix is None:
+        return index, scenario, None
+    return index, scenario, publish_traces(traces, prefix)
+
+
+def run_sweep(simulate, scenarios, n_workers=None, return_traces=True):
+    """
+    Run a parameter sweep in parallel worker processes.
+
+    The traces of every run are published in shared memory by the worker, so
+    only a small descriptor is pickled back to this process instead of the
+    full Cavity/Valve/Patch arrays.
+
+    Parameters:
+    simulate (callable): Module level function scenario -> TraceSet that builds and runs the model.
+    scenarios (list): Scenario parameters (any picklable object, e.g. a dict).
+    n_workers (int, optional): Number of worker processes (default: number of cores).
+    return_traces (bool): If False, the traces are not sent back (e.g. when simulate saves them itself).
+
+    Yields:
+    tuple: (scenario, SharedTraces or None) in the order the runs finish. The
+           caller owns the SharedTraces and must release() them (or use 'with').
+           Traces that were not yielded yet when the generator is closed early (or an
+           exception occurs) are freed here.
+    """
+    # Start the resource tracker here, so the workers share it and their blocks
+    # are not cleaned up when a worker exits before the parent attached.
+    resource_tracker.ensure_running()
+
+    # Every run publishes its blocks under a known prefix, so unclaimed blocks can be found
+    sweep_id = uuid.uuid4().hex[:12]
+    prefixes = [f'sw{sweep_id}_{i}' if return_traces else None for i in range(len(scenarios))]
+    jobs = [(simulate, i, scenario, prefix) for i, (scenario, prefix) in enumerate(zip(scenarios, prefixes))]
+    pending = set(range(len(jobs)))
+
+    pool = Pool(n_workers or os.cpu_count())
+    try:
+        for index, scenario, descriptor in pool.imap_unordered(_run_scenario, jobs):
+            pending.discard(index)
+            yield scenario, SharedTraces(descriptor) if descriptor is not None else None
+    finally:
+        pool.terminate()
+        pool.join()
+        if return_traces:
+            for index in pending:
+                unlink_blocks(prefixes[index])
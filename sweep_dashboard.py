@@ -0,0 +1,131 @@
+import os
+import numpy as np
+import matplotlib.pyplot as plt
+from plot_functions import OverviewTemplate
+from trace_store import TraceSet
+from trace_pyramid import stored_pyramids
+
+# Summary metrics of the heatmaps: (title, function of the per-beat metrics of one run)
+SUMMARY_METRICS = [
+    ('Mean CO [L/min]', lambda m: np.mean(m['aortic_CO'])),
+    ('SVV [%]', lambda m: 100 * np.ptp(m['SV_lv']) / np.mean(m['SV_lv'])),
+    ('EF [-]', lambda m: np.mean(m['EF'])),
+    ('LA stress [kPa]', lambda m: np.mean(m['LA_stress'])),
+]
+
+
+def summary_grid(runs, param_x, param_y, metrics=SUMMARY_METRICS):
+    """
+    Arrange summary metrics of sweep runs on the grid of two swept parameters.
+
+    Parameters:
+    runs (dict): Run name -> (params dict, per-beat metrics dict), e.g. from ReanalysisPipeline.
+    param_x, param_y (str): Names of the swept parameters.
+    metrics (list): (title, function) pairs, see SUMMARY_METRICS.
+
+    Returns:
+    tuple: (x_values, y_values, grids (n_metrics, n_y, n_x), names (n_y, n_x) of the run per cell)
+    """
+    names = list(runs.keys())
+    x = np.array([runs[name][0][param_x] for name in names], dtype=float)
+    y = np.array([runs[name][0][param_y] for name in names], dtype=float)
+    x_values, ix = np.unique(x, return_inverse=True)
+    y_values, iy = np.unique(y, return_inverse=True)
+
+    grids = np.full((len(metrics), len(y_values), len(x_values)), np.nan)
+    values = np.array([[f(runs[name][1]) for _, f in metrics] for name in names]).reshape(len(names), -1)
+    grids[:, iy, ix] = values.T
+    cell_names = np.full((len(y_values), len(x_values)), None, dtype=object)
+    cell_names[iy, ix] = names
+    return x_values, y_values, grids, cell_names
+
+
+class SweepDashboard:
+    def __init__(self, trace_dir, runs, param_x, param_y, metrics=SUMMARY_METRICS, pv_color='beat'):
+        """
+        Heatmaps of summary metrics over two swept parameters. Clicking a cell loads
+        the stored traces of that run (only then) and shows them in the overview layout.
+
+        Usage:
+            pipeline = ReanalysisPipeline(trace_dir)
+            pipeline.run()
+            runs = load_sweep_runs(trace_dir, pipeline.load_results())
+            SweepDashboard(trace_dir, runs, 'p_max', 'Sf_act_scale').show()
+
+        Parameters:
+        trace_dir (str): Directory with the stored traces '<run name>.npz'.
+        runs (dict): Run name -> (params dict, per-beat metrics dict).
+        param_x, param_y (str): Names of the swept parameters.
+        metrics (list): (title, function) pairs, see SUMMARY_METRICS.
+        pv_color (str): Coloring of the PV loops of the overview: 'beat' or 'phase' (respiratory phase).
+        """
+        self.trace_dir = trace_dir
+        self.runs = runs
+        self.param_x = param_x
+        self.param_y = param_y
+        self.pv_color = pv_color
+        self.x_values, self.y_values, self.grids, self.names = summary_grid(runs, param_x, param_y, metrics)
+
+        n = len(metrics)
+        self.fig, axes = plt.subplots(1, n, figsize=(4 * n, 4), squeeze=False)
+        self.axes = axes[0]
+        for ax, (title, _), grid in zip(self.axes, metrics, self.grids):
+            image = ax.imshow(grid, origin='lower', aspect='auto', interpolation='nearest',
+                              extent=self._extent(), cmap='viridis')
+            self.fig.colorbar(image, ax=ax)
+            ax.set_xticks(range(len(self.x_values)), [f'{v:g}' for v in self.x_values])
+            ax.set_yticks(range(len(self.y_values)), [f'{v:g}' for v in self.y_values])
+            ax.set_xlabel(param_x)
+            ax.set_ylabel(param_y)
+            ax.set_title(title, fontweight='bold')
+        self.fig.tight_layout()
+        self.fig.canvas.mpl_connect('button_press_event', self._on_click)
+
+        self.template = None
+        self.selected = None
+
+    def _extent(self):
+        # One cell per parameter value (indexed, not to scale)
+        return (-0.5, len(self.x_values) - 0.5, -0.5, len(self.y_values) - 0.5)
+
+    def _on_click(self, event):
+        if event.inaxes not in self.axes or event.xdata is None:
+            return
+        ix, iy = int(round(event.xdata)), int(round(event.ydata))
+        if 0 <= ix < len(self.x_values) and 0 <= iy < len(self.y_values) and self.names[iy, ix] is not None:
+            self.show_run(self.names[iy, ix])
+
+    def show_run(self, name):
+        """
+        Load the stored traces of one run and show them in the (reused) overview layout.
+        """
+        metrics = self.runs[name][1]
+        if self.template is None or not plt.fignum_exists(self.template.fig.number):
+            self.template = OverviewTemplate(pv_color=self.pv_color)
+        # Only the plotted arrays are read, the file is closed again afterwards
+        path = os.path.join(self.trace_dir, name + '.npz')
+        with TraceSet.load(path, lazy=True) as traces:
+            self.template.update(traces, traces.cycle_times, traces.n_beats, traces.breath_cycle_time,
+                                 metrics['aortic_CO'], metrics['pulmonary_CO'], pyramids=stored_pyramids(path, traces))
+            self.template.fig.suptitle(f'{name}: {self.param_x} = {traces.meta["params"].get(self.param_x)}, '
+                                       f'{self.param_y} = {traces.meta["params"].get(self.param_y)}')
+        self.template.draw()
+        self.selected = name
+
+    def show(self):
+        plt.show()
+
+
+def load_sweep_runs(trace_dir, results):
+    """
+    Combine the per-beat metrics of ReanalysisPipeline.load_results with the simulation
+    parameters stored in the traces (only the meta data of the trace files is read).
+
+    Returns:
+    dict: Run name -> (params dict, per-beat metrics dict).
+    """
+    runs = {}
+    for name, metrics in results.items():
+        meta = TraceSet.load_meta(os.path.join(trace_dir, name + '.npz'))
+        runs[name] = (meta['params'], metrics)
+    return runs
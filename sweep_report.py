@@ -0,0 +1,174 @@
+import os
+import html
+import json
+import hashlib
+import numpy as np
+import matplotlib
+from batch_render import render_batch, overview_jobs
+from reanalysis import ReanalysisPipeline
+from sweep_dashboard import SUMMARY_METRICS, load_sweep_runs
+
+
+def render_cache_key(job):
+    """
+    Hash of everything that determines a figure: the plot options, the arguments
+    and, for overviews, the content of the trace file.
+    """
+    digest = hashlib.sha1()
+    options = {key: value for key, value in job.items() if key not in ('args', 'kwargs', 'output_dir', 'name')}
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+    digest.update(json.dumps(job.get('kwargs', {}), sort_keys=True, default=str).encode())
+    for arg in job.get('args', ()):
+        if isinstance(arg, str):
+            digest.update(arg.encode())
+        else:
+            digest.update(np.ascontiguousarray(arg, dtype=float).tobytes())
+    if 'trace_path' in job:
+        with open(job['trace_path'], 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+    digest.update(matplotlib.__version__.encode())
+    return digest.hexdigest()
+
+
+class SweepReport:
+    def __init__(self, trace_dir, report_dir, n_workers=None):
+        """
+        One report per sweep: a summary table, comparison charts and the overview of every run.
+
+        Figures are rendered in parallel (batch_render.py) into report_dir/figures and named
+        after render_cache_key, so after adding runs only the new figures are rendered.
+
+        Parameters:
+        trace_dir (str): Directory with the stored traces of the sweep.
+        report_dir (str): Output directory of the report.
+        n_workers (int, optional): Number of worker processes (default: number of cores).
+        """
+        self.trace_dir = trace_dir
+        self.report_dir = report_dir
+        self.figure_dir = os.path.join(report_dir, 'figures')
+        self.n_workers = n_workers
+        self.pipeline = ReanalysisPipeline(trace_dir, n_workers=n_workers)
+
+    def _jobs(self, runs):
+        names = sorted(runs)
+        jobs = []
+        if names:
+            n_beats = len(runs[names[0]][1]['aortic_CO'])
+            for metric, y_label in [('aortic_CO', 'Cardiac Output (L/min)'),
+                                    ('pulmonary_CO', 'Cardiac Output (L/min)'),
+                                    ('LA_stress', 'Mean LA stress (kPa)')]:
+                values = np.array([runs[name][1][metric] for name in names])
+                jobs.append({'plot': 'plot_grouped_bars', 'n_beats': n_beats,
+                             'args': (values, f'Comparison of {metric} per run', y_label),
+                             'kwargs': {'conditions': names}})
+        paths = [os.path.join(self.trace_dir, name + '.npz') for name in names]
+        jobs += overview_jobs(paths, self.figure_dir)
+
+        for job in jobs:
+            job['output_dir'] = self.figure_dir
+            job['name'] = render_cache_key(job)
+        return jobs
+
+    def render(self, jobs):
+        """
+        Render the figures that are not in the cache yet.
+
+        Returns:
+        list: Jobs that were rendered.
+        """
+        os.makedirs(self.figure_dir, exist_ok=True)
+        missing = [job for job in jobs
+                   if not os.path.exists(os.path.join(self.figure_dir, job['name'] + '.png'))]
+        if missing:
+            render_batch(missing, self.n_workers)
+        return missing
+
+    def summary_table(self, runs):
+        """
+        Returns:
+        tuple: (column names, rows) with the parameters and summary metrics per run.
+        """
+        params = sorted({key for params, _ in runs.values() for key in params})
+        columns = ['Run'] + params + [title for title, _ in SUMMARY_METRICS]
+        rows = []
+        for name in sorted(runs):
+            run_params, metrics = runs[name]
+            rows.append([name] + [run_params.get(key, '') for key in params]
+                        + [f'{f(metrics):.3g}' for _, f in SUMMARY_METRICS])
+        return columns, rows
+
+    def build(self, formats=('html',)):
+        """
+        Re-analyse stale runs, render missing figures and write the report.
+
+        Parameters:
+        formats (tuple): 'html' and/or 'pdf'.
+
+        Returns:
+        list: Paths of the written report files.
+        """
+        self.pipeline.run()
+        runs = load_sweep_runs(self.trace_dir, self.pipeline.load_results())
+        jobs = self._jobs(runs)
+        self.render(jobs)
+        columns, rows = self.summary_table(runs)
+
+        paths = []
+        if 'html' in formats:
+            paths.append(self._write_html(columns, rows, jobs))
+        if 'pdf' in formats:
+            paths.append(self._write_pdf(columns, rows, jobs))
+        return paths
+
+    def _figure_title(self, job):
+        if job['plot'] == 'overview':
+            return os.path.splitext(os.path.basename(job['trace_path']))[0]
+        return job['args'][1]
+
+    def _write_html(self, columns, rows, jobs):
+        path = os.path.join(self.report_dir, 'index.html')
+        parts = ['<html><head><meta charset="utf-8"><title>Sweep report</title>',
+                 '<style>table{border-collapse:collapse}td,th{border:1px solid #999;padding:2px 6px}'
+                 'img{max-width:100%}</style></head><body>',
+                 f'<h1>Sweep report: {html.escape(self.trace_dir)}</h1>', '<h2>Summary</h2><table><tr>']
+        parts += [f'<th>{html.escape(str(c))}</th>' for c in columns] + ['</tr>']
+        for row in rows:
+            parts += ['<tr>'] + [f'<td>{html.escape(str(v))}</td>' for v in row] + ['</tr>']
+        parts.append('</table>')
+
+        for section, kind in [('Comparisons', False), ('Runs', True)]:
+            parts.append(f'<h2>{section}</h2>')
+            for job in jobs:
+                if (job['plot'] == 'overview') == kind:
+                    parts.append(f'<h3>{html.escape(self._figure_title(job))}</h3>'
+                                 f'<img src="figures/{job["name"]}.png">')
+        parts.append('</body></html>')
+
+        with open(path, 'w') as file:
+            file.write('\n'.join(parts))
+        return path
+
+    def _write_pdf(self, columns, rows, jobs):
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        path = os.path.join(self.report_dir, 'report.pdf')
+        with PdfPages(path) as pdf:
+            fig = plt.figure(figsize=(11.7, 8.3))
+            fig.suptitle('Sweep report - summary', fontweight='bold')
+            ax = fig.add_subplot(111)
+            ax.axis('off')
+            if rows:
+                ax.table(cellText=rows, colLabels=columns, loc='upper center').auto_set_font_size(True)
+            pdf.savefig(fig)
+            plt.close(fig)
+
+            # The cached PNGs are placed on the pages, nothing is rendered again
+            for job in jobs:
+                image = plt.imread(os.path.join(self.figure_dir, job['name'] + '.png'))
+                fig = plt.figure(figsize=(image.shape[1] / 100, image.shape[0] / 100))
+                fig.figimage(image)
+                pdf.savefig(fig)
+                plt.close(fig)
+        return path
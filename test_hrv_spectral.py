@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+from hrv_spectral import hrv_spectrum
+
+
+def rr_sinusoid(n, interval, amplitude=0.01, frequency=0.25):
+    # RR intervals [s] with a sinusoidal modulation, sampled every interval
+    times = np.arange(n) * interval
+    return times, 0.8 + amplitude * np.sin(2 * np.pi * frequency * times)
+
+
+@pytest.mark.parametrize('n', [60, 150, 400, 1500])
+def test_lomb_band_power_is_variance(n):
+    # A 10 ms sinusoid has a variance of 50 ms^2, whatever the record length
+    times, rr = rr_sinusoid(n, 0.8)
+    result = hrv_spectrum(times, rr, 4.0, method='lomb')
+    assert result['HF'] == pytest.approx(50, rel=0.03)
+    assert result['LF'] < 0.01 * result['HF']
+
+
+@pytest.mark.parametrize('n', [400, 1600])
+def test_lomb_matches_welch(n):
+    # Sampled on the Welch grid (4 Hz), so the resampling does not attenuate the sinusoid
+    times, rr = rr_sinusoid(n, 0.25)
+    lomb = hrv_spectrum(times, rr, 4.0, method='lomb')
+    welch = hrv_spectrum(times, rr, 4.0, method='welch')
+    assert lomb['HF'] == pytest.approx(welch['HF'], rel=0.03)
+    assert lomb['HF'] == pytest.approx(np.var(rr * 1e3), rel=0.03)
+
+
+def test_breathing_frequency_outside_grid():
+    times, rr = rr_sinusoid(100, 0.8)
+    result = hrv_spectrum(times, rr, 1.5)  # 0.67 Hz, above the 'lomb' grid
+    assert result['respiratory_frequency'] == pytest.approx(result['frequencies'][-1])
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from trace_store import TraceSet, SIGNALS, VALVES
+from valve_events import ValveEvents
+
+
+def pulse(t, start, end):
+    # Half-sine flow pulse between start and end
+    return np.where((t > start) & (t < end), np.sin(np.pi * (t - start) / (end - start)), 0)
+
+
+def atrial_kick_traces(n_beats=6, cycle_time=0.8):
+    # Beats start at the atrial trigger: A-wave, then ejection, then the E-wave after IVRT,
+    # with no mitral flow during diastasis
+    t = np.arange(0, n_beats * cycle_time, 0.001)
+    phase = t % cycle_time
+    arrays = {'Solver.t': t}
+    for (component, var), names in SIGNALS.items():
+        arrays[f'{component}.{var}'] = np.zeros((len(t), len(names)))
+    q = arrays['Valve.q']
+    q[:, VALVES.index('LaLv')] = 2e-4 * pulse(phase, 0.02, 0.12) + 5e-4 * pulse(phase, 0.50, 0.65)
+    q[:, VALVES.index('LvSyArt')] = 4e-4 * pulse(phase, 0.17, 0.45)
+    arrays['Cavity.V'][:] = 120e-6
+    meta = {'cycle_times': [0, cycle_time], 'n_beats': 1, 'breath_cycle_time': cycle_time, 'store_beats': n_beats}
+    return TraceSet(arrays, meta)
+
+
+def test_phases_follow_cardiac_order():
+    traces = atrial_kick_traces()
+    events = ValveEvents(traces, traces.cycle_times, traces.breath_cycle_time)
+    phases = events.phases('left')
+    assert phases['IVCT'] == pytest.approx(np.full(6, 50), abs=2)
+    assert phases['ET'] == pytest.approx(np.full(6, 280), abs=2)
+    assert phases['IVRT'] == pytest.approx(np.full(6, 50), abs=2)
+
+
+def test_missing_event_is_nan():
+    traces = atrial_kick_traces()
+    traces.arrays['Valve.q'][:, VALVES.index('LvSyArt')] = 0
+    phases = ValveEvents(traces, traces.cycle_times, traces.breath_cycle_time).phases('left')
+    assert np.all(np.isnan(phases['ET'])) and np.all(np.isnan(phases['IVRT']))
@@ -0,0 +1,154 @@
+import os
+import numpy as np
+
+# Samples merged per level: level k holds min/max of factor**k samples
+PYRAMID_FACTOR = 4
+
+
+class TracePyramid:
+    def __init__(self, t, levels):
+        """
+        Multi-resolution min/max representation of one signal.
+
+        Parameters:
+        t (ndarray): Time points of the full resolution signal.
+        levels (list): levels[0] is the full signal, levels[k] an array (n_k, 2)
+                       with the min and max of PYRAMID_FACTOR**k samples.
+        """
+        self.t = t
+        self.levels = levels
+
+    @classmethod
+    def build(cls, t, y, factor=PYRAMID_FACTOR, min_size=256):
+        """
+        Build the pyramid of signal y (any length; the last bucket of a level may be partial).
+        """
+        levels = [np.asarray(y, dtype=float)]
+        lo = hi = levels[0]
+        while len(lo) > min_size:
+            n = len(lo) // factor * factor
+            lo_next = lo[:n].reshape(-1, factor).min(axis=1)
+            hi_next = hi[:n].reshape(-1, factor).max(axis=1)
+            if n < len(lo):
+                lo_next = np.append(lo_next, lo[n:].min())
+                hi_next = np.append(hi_next, hi[n:].max())
+            lo, hi = lo_next, hi_next
+            levels.append(np.column_stack([lo, hi]))
+        return cls(np.asarray(t, dtype=float), levels)
+
+    def level_for(self, i_start, i_stop, n_pixels):
+        """
+        Coarsest level that still has at least one bucket per pixel in the index range.
+        """
+        n_samples = max(i_stop - i_start, 1)
+        level = 0
+        while (level + 1 < len(self.levels)
+               and n_samples / PYRAMID_FACTOR ** (level + 1) >= n_pixels):
+            level += 1
+        return level
+
+    def view(self, t_min=None, t_max=None, n_pixels=1000):
+        """
+        Data to draw the signal between t_min and t_max on n_pixels pixels.
+
+        Returns:
+        tuple: (t, y) with min and max of every bucket interleaved, so peaks are kept.
+        """
+        i_start = 0 if t_min is None else max(np.searchsorted(self.t, t_min) - 1, 0)
+        i_stop = len(self.t) if t_max is None else min(np.searchsorted(self.t, t_max) + 1, len(self.t))
+        level = self.level_for(i_start, i_stop, n_pixels)
+        if level == 0:
+            return self.t[i_start:i_stop], self.levels[0][i_start:i_stop]
+
+        size = PYRAMID_FACTOR ** level
+        b_start, b_stop = i_start // size, -(-i_stop // size)
+        buckets = self.levels[level][b_start:b_stop]
+        # min at the start, max at the middle of each bucket (order does not matter visually)
+        t_lo = self.t[np.minimum(np.arange(b_start, b_stop) * size, len(self.t) - 1)]
+        t_hi = self.t[np.minimum(np.arange(b_start, b_stop) * size + size // 2, len(self.t) - 1)]
+        return np.column_stack([t_lo, t_hi]).ravel(), buckets.ravel()
+
+
+def signal_key(component, var, name):
+    return f'{component}.{var}:{name}'
+
+
+def build_pyramids(traces):
+    """
+    Build a pyramid for every stored signal of a TraceSet.
+
+    Returns:
+    dict: signal_key(component, var, name) -> TracePyramid.
+    """
+    from trace_store import SIGNALS
+    pyramids = {}
+    for (component, var), names in SIGNALS.items():
+        table = traces[component][var]
+        for name in names:
+            pyramids[signal_key(component, var, name)] = TracePyramid.build(traces.t, table[:, name])
+    return pyramids
+
+
+def pyramid_path(trace_path):
+    """
+    Path of the pyramid file that belongs to a stored trace file ('<run>.pyramid.npz').
+    """
+    base = trace_path[:-4] if trace_path.endswith('.npz') else trace_path
+    return base + '.pyramid.npz'
+
+
+def stored_pyramids(trace_path, traces):
+    """
+    Pyramids saved next to a stored trace file (save_traces(..., pyramids=True)).
+
+    Parameters:
+    trace_path (str): Path of the stored trace file.
+    traces (TraceSet): The traces loaded from it, which supply the full resolution level.
+
+    Returns:
+    dict or None: The pyramids, or None if there is no pyramid file or it is older than the traces.
+    """
+    path = pyramid_path(trace_path)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(trace_path):
+        return None
+    return load_pyramids(path, traces)
+
+
+def save_pyramids(pyramids, path):
+    """
+    Save the coarse levels of the pyramids (compressed, in float32 which is plenty for drawing).
+    The time points are stored once and level 0 not at all: it is the stored signal itself,
+    see load_pyramids.
+    """
+    arrays = {}
+    for key, pyramid in pyramids.items():
+        arrays['t'] = pyramid.t
+        for k, level in enumerate(pyramid.levels[1:], 1):
+            arrays[f'{key}:{k}'] = level.astype(np.float32)
+    np.savez_compressed(path, **arrays)
+
+
+def load_pyramids(path, traces):
+    """
+    Pyramids saved with save_pyramids, with level 0 taken from the traces they were built from.
+
+    Returns:
+    dict: signal_key(component, var, name) -> TracePyramid.
+    """
+    from trace_store import SIGNALS
+    signals = {signal_key(component, var, name): (component, var, name)
+               for (component, var), names in SIGNALS.items() for name in names}
+    grouped = {}
+    with np.load(path) as data:
+        t = data['t'] if 't' in data.files else None
+        for name in data.files:
+            if name != 't':
+                key, level = name.rsplit(':', 1)
+                grouped.setdefault(key, {})[int(level)] = data[name]
+
+    pyramids = {}
+    for key, parts in grouped.items():
+        component, var, name = signals[key]
+        full = np.asarray(traces[component][var][:, name], dtype=float)
+        pyramids[key] = TracePyramid(t, [full] + [parts[k] for k in range(1, len(parts) + 1)])
+    return pyramids
@@ -0,0 +1,200 @@
+import json
+import numpy as np
+
+# Signals that are stored for every run (same names as used in the model)
+CAVITIES = ['Ra', 'cRv', 'PuArt', 'La', 'cLv', 'SyArt']
+VALVES = ['SyVenRa', 'RaRv', 'RvPuArt', 'PuVenLa', 'LaLv', 'LvSyArt']
+PATCHES = ['pRa0', 'pRv0', 'pLa0', 'pLv0', 'pSv0']
+
+# (component, variable) -> column names, in storage order
+SIGNALS = {
+    ('Cavity', 'V'): CAVITIES,
+    ('Cavity', 'p'): CAVITIES,
+    ('Valve', 'q'): VALVES,
+    ('Patch', 'Sf'): PATCHES,
+    ('Thorax', 'p'): [0],
+}
+
+
+class SignalTable:
+    def __init__(self, data, names):
+        """
+        2D signal array (time x columns) that can be indexed with column names,
+        the same way as the model: table[:, 'cLv'] or table[:, ['cLv', 'cRv']].
+
+        Parameters:
+        data (ndarray): Array of shape (n_samples, n_columns).
+        names (list): Column names, in the order of the columns of data.
+        """
+        self.data = data
+        self.names = list(names)
+
+    def _column(self, name):
+        if name in self.names:
+            return self.names.index(name)
+        if isinstance(name, (int, np.integer)):
+            return int(name)
+        raise KeyError(f"Unknown signal '{name}', choose from {self.names}")
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            return self.data[key]
+        rows, cols = key
+        if isinstance(cols, (list, tuple)):
+            cols = [self._column(c) for c in cols]
+        elif not isinstance(cols, slice):
+            cols = self._column(cols)
+        return self.data[rows, cols]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.data, dtype=dtype)
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+
+class TraceSet:
+    def __init__(self, arrays, meta):
+        """
+        Stored traces of one simulation run, indexable like the model itself
+        (traces['Cavity']['V'][:, 'cLv'], traces['Solver']['t']) so that the
+        calculators and plotters can be used without re-simulating.
+
+        Parameters:
+        arrays (dict): Flat dict with keys 'Solver.t' and 'Component.var' (see SIGNALS).
+        meta (dict): Run information: cycle_times, n_beats, breath_cycle_time, store_beats
+                     and optionally the simulation parameters ('params').
+        """
+        self.arrays = arrays
+        self.meta = meta
+        self.cache = {}  # derived results (metrics, timelines, ...) of this run
+
+    @classmethod
+    def from_model(cls, model, cycle_times, params=None):
+        """
+        Take a snapshot of the signals of interest after model.run().
+
+        Parameters:
+        model: Model that was used in the simulation that contains all the data.
+        cycle_times (list): List of cycle times for each beat (first value 0).
+        params (dict, optional): Simulation parameters to store with the traces.
+        """
+        arrays = {'Solver.t': np.array(model['Solver']['t'], dtype=float)}
+        for (component, var), names in SIGNALS.items():
+            data = model[component][var][:, names]
+            arrays[f'{component}.{var}'] = np.array(data, dtype=float).reshape(len(arrays['Solver.t']), -1)
+
+        cycle_times = [float(c) for c in cycle_times]
+        meta = {
+            'cycle_times': cycle_times,
+            'n_beats': len(cycle_times) - 1,
+            'breath_cycle_time': float(np.sum(cycle_times)),
+            'store_beats': int(model['Solver']['store_beats']),
+            'params': params or {},
+        }
+        return cls(arrays, meta)
+
+    def __getitem__(self, component):
+        if component == 'Solver':
+            return {'t': self.arrays['Solver.t'], 'store_beats': self.meta['store_beats']}
+        variables = {}
+        for (comp, var), names in SIGNALS.items():
+            if comp == component:
+                variables[var] = SignalTable(self.arrays[f'{comp}.{var}'], names)
+        if not variables:
+            raise KeyError(component)
+        return variables
+
+    @property
+    def t(self):
+        return self.arrays['Solver.t']
+
+    @property
+    def cycle_times(self):
+        return self.meta['cycle_times']
+
+    @property
+    def n_beats(self):
+        return self.meta['n_beats']
+
+    @property
+    def breath_cycle_time(self):
+        return self.meta['breath_cycle_time']
+
+    def save(self, path):
+        """
+        Save the traces to a compressed .npz file (meta data is stored as json).
+        """
+        np.savez_compressed(path, __meta__=json.dumps(self.meta), **self.arrays)
+
+    @classmethod
+    def load(cls, path, lazy=False):
+        """
+        Load traces saved with TraceSet.save (or a compacted archive, see compaction.py).
+
+        Parameters:
+        path (str): Path of the .npz file.
+        lazy (bool): Only read the meta data now; arrays are read on first access.
+        """
+        data = np.load(path)
+        if '__compact__' in data.files:
+            data.close()
+            from compaction import CompactTraceSet
+            return CompactTraceSet.load(path).expand()
+
+        meta = json.loads(str(data['__meta__']))
+        if lazy:
+            arrays = _LazyArrays(data)
+        else:
+            arrays = {key: data[key] for key in data.files if key != '__meta__'}
+            data.close()
+        return cls(arrays, meta)
+
+    def close(self):
+        """
+        Close the .npz file of lazily loaded traces; arrays read so far stay available.
+        """
+        if isinstance(self.arrays, _LazyArrays):
+            self.arrays.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def load_meta(path):
+        """
+        Read only the meta data (cycle times, parameters, ...) of stored traces.
+        """
+        with np.load(path) as data:
+            return json.loads(str(data['__meta__']))
+
+
+class _LazyArrays(dict):
+    """Dict that reads arrays from an open .npz file on first access."""
+    def __init__(self, npz):
+        super().__init__()
+        self._npz = npz
+
+    def __missing__(self, key):
+        if self._npz is None:
+            raise KeyError(f"{key} was not read before the traces were closed")
+        value = self._npz[key]
+        self[key] = value
+        return value
+
+    def keys(self):
+        if self._npz is None:
+            return list(super().keys())
+        return [key for key in self._npz.files if key != '__meta__']
+
+    def close(self):
+        if self._npz is not None:
+            self._npz.close()
+            self._npz = None
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
@@ -0,0 +1,152 @@
+import numpy as np
+from heartrate import HeartRateTimeline
+from trace_store import VALVES
+
+# Inflow valve, outflow valve and ventricle of both sides of the heart
+SIDES = {
+    'left': ('LaLv', 'LvSyArt', 'cLv'),
+    'right': ('RaRv', 'RvPuArt', 'cRv'),
+}
+
+
+def valve_crossings(t, q, threshold=0.01):
+    """
+    Find all opening and closing instants of a set of valves in one pass.
+
+    A valve is open while its flow is above threshold * its peak forward flow; the
+    instants are linearly interpolated between the samples around the crossing.
+
+    Parameters:
+    t (ndarray): Time points (n).
+    q (ndarray): Valve flows (n x n_valves), positive in the forward direction.
+    threshold (float): Fraction of the peak forward flow at which a valve counts as open.
+
+    Returns:
+    tuple: (sample index before the crossing, valve column, crossing time, opening (bool)),
+           sorted by sample.
+    """
+    t = np.asarray(t, dtype=float)
+    q = np.asarray(q, dtype=float)
+    level = threshold * np.max(q, axis=0)
+    is_open = q > level
+    change = np.diff(is_open.astype(np.int8), axis=0)
+    index, valve = np.nonzero(change)
+
+    q0, q1 = q[index, valve], q[index + 1, valve]
+    fraction = (level[valve] - q0) / (q1 - q0)
+    times = t[index] + fraction * (t[index + 1] - t[index])
+    return index, valve, times, change[index, valve] > 0
+
+
+def _first_per_beat(beat, valve, values, n_beats, n_valves):
+    # values are in time order, so the first occurrence of every (beat, valve) is the earliest
+    result = np.full((n_beats, n_valves), np.nan)
+    keys, first = np.unique(beat * n_valves + valve, return_index=True)
+    result[keys // n_valves, keys % n_valves] = values[first]
+    return result
+
+
+class ValveEvents:
+    def __init__(self, traces, cycle_times, breath_cycle_time, threshold=0.01):
+        """
+        Opening and closing instants of the six valves for every stored beat, and the
+        cardiac phase timing and volumes that follow from them.
+
+        Parameters:
+        traces: Model or stored TraceSet that contains all the data.
+        cycle_times (list): List of cycle times for each beat.
+        breath_cycle_time (float): Length of one breathing cycle [s].
+        threshold (float): Fraction of the peak forward flow at which a valve counts as open.
+        """
+        self.traces = traces
+        self.timeline = HeartRateTimeline.for_model(traces, cycle_times, breath_cycle_time)
+        t = self.timeline.time_points
+        q = traces['Valve']['q'][:, VALVES]
+        n_beats, n_valves = self.timeline.n_beats, len(VALVES)
+
+        index, valve, times, opening = valve_crossings(t, q, threshold)
+        beat = self.timeline.beat_of_sample[index + 1]
+        self.crossings = (beat, valve, times, opening)
+        self.open_times = _first_per_beat(beat[opening], valve[opening], times[opening], n_beats, n_valves)
+        self.close_times = _first_per_beat(beat[~opening], valve[~opening], times[~opening], n_beats, n_valves)
+
+        # Backward flow per beat: cumulative trapezoid of the negative part of the flow
+        backward = np.minimum(q, 0)
+        cumulative = np.concatenate([np.zeros((1, n_valves)),
+                                     np.cumsum(0.5 * (backward[1:] + backward[:-1]) * np.diff(t)[:, None], axis=0)])
+        last = self.timeline.beat_ends - 1
+        self.regurgitant_volume = -(cumulative[last] - cumulative[self.timeline.beat_starts]) * 1e6  # ml
+
+    def opens(self, valve):
+        """
+        Returns:
+        ndarray: Opening time [s] of the valve in every beat (NaN if it did not open).
+        """
+        return self.open_times[:, VALVES.index(valve)]
+
+    def closes(self, valve):
+        """
+        Returns:
+        ndarray: Closing time [s] of the valve in every beat (NaN if it did not close).
+        """
+        return self.close_times[:, VALVES.index(valve)]
+
+    def first_after(self, valve, opening, after):
+        """
+        First opening (or closing) of a valve in every beat after a given instant of that beat.
+
+        Parameters:
+        valve (str): Valve name (see VALVES).
+        opening (bool): True for openings, False for closings.
+        after (ndarray): Time [s] per beat after which the event is searched (NaN: no event).
+
+        Returns:
+        ndarray: Event time [s] per beat (NaN if there is no such event).
+        """
+        beat, valve_column, times, is_opening = self.crossings
+        select = (valve_column == VALVES.index(valve)) & (is_opening == opening)
+        beat, times = beat[select], times[select]
+        later = times > after[beat]
+        return _first_per_beat(beat[later], np.zeros(np.sum(later), dtype=int), times[later],
+                               self.timeline.n_beats, 1)[:, 0]
+
+    def phases(self, side='left'):
+        """
+        Cardiac phase timing and volumes of one ventricle for every beat.
+
+        Parameters:
+        side (str): 'left' (mitral and aortic valve, LV) or 'right' (tricuspid and pulmonary valve, RV).
+
+        Returns:
+        dict: 'IVCT', 'ET', 'IVRT' [ms], 'EDV', 'ESV', 'SV' [ml] and 'EF' [-] per beat.
+              EDV is the volume at closure of the inflow valve, ESV at closure of the outflow valve.
+              The events are paired in cardiac order (the outflow valve opens after the inflow
+              valve closed, the inflow valve reopens after the outflow valve closed), so an
+              atrial-kick opening early in the beat is not taken for the end of IVRT.
+        """
+        inflow, outflow, cavity = SIDES[side]
+        inflow_closes = self.closes(inflow)
+        outflow_opens = self.first_after(outflow, True, inflow_closes)
+        outflow_closes = self.first_after(outflow, False, outflow_opens)
+        inflow_opens = self.first_after(inflow, True, outflow_closes)
+
+        t = self.timeline.time_points
+        V = self.traces['Cavity']['V'][:, cavity] * 1e6
+        EDV = np.interp(inflow_closes, t, V)
+        ESV = np.interp(outflow_closes, t, V)
+        return {
+            'IVCT': (outflow_opens - inflow_closes) * 1e3,
+            'ET': (outflow_closes - outflow_opens) * 1e3,
+            'IVRT': (inflow_opens - outflow_closes) * 1e3,
+            'EDV': EDV,
+            'ESV': ESV,
+            'SV': EDV - ESV,
+            'EF': (EDV - ESV) / EDV,
+        }
+
+    def regurgitation(self, valve):
+        """
+        Returns:
+        ndarray: Backward flow volume [ml] through the valve in every beat.
+        """
+        return self.regurgitant_volume[:, VALVES.index(valve)]